@@ -1,50 +1,195 @@
 import polars as pl
-from datetime import datetime
+from datetime import date, datetime
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
+from alert_rules import DEFAULT_RULES, RuleSet, msk_date
+from candle_store import CandleStore
+from indicators import StreamingIndicators
+
 
 TARGET_TZ = ZoneInfo("Europe/Moscow")
 
+LOOKBACK = 60
+
+TIMESTAMP_DTYPE = pl.Datetime(time_unit="us", time_zone="UTC")
+
 
 class AlertEngine:
-    def __init__(self):
-        self.current_trading_day = None
+    def __init__(self, rules: RuleSet | None = None, rules_path: Path | None = None,
+                 indicators: StreamingIndicators | None = None, timeframe: int = 1,
+                 verify: bool = False):
         self.daily_open: dict[str, float] = {}
-        self.alert_1_percent_open = set()
-        self.last_1m_alert: dict[str, datetime] = {}
+        self.daily_open_date: dict[str, date] = {}
+        # Время последнего алерта: имя правила -> uid -> время свечи
+        self.last_alert: dict[str, dict[str, datetime]] = {}
+
+        # Таймфрейм баров, которые получает движок, и правила только для него
+        self.timeframe = timeframe
+        self.rules = RuleSet(DEFAULT_RULES, timeframe)
+        self.rules_path = rules_path
+        self.rules_mtime: float | None = None
+        # Индикаторы обновляет пайплайн, движок только читает текущие значения
+        self.indicators = indicators
+
+        # Инкрементальный режим: uid истории, ожидающие первого вызова
+        # analyze_batch, и флаг проверки всех инструментов после смены правил.
+        # Сами бары движок берет из общего хранилища пайплайна
+        self.pending_uids: set[str] = set()
+        self.check_all = False
+
+        # Сверка с полным проходом: теневой движок со своей дедупликацией
+        self.verify = verify
+        self.shadow = AlertEngine(indicators=indicators, timeframe=timeframe) if verify else None
+
+        if rules is not None:
+            self.set_rules(rules)
+        elif rules_path is not None:
+            self.load_rules()
+        # Первые правила применяются к истории через seed(check=True)
+        self.check_all = False
+
+    def set_rules(self, rules: RuleSet):
+        """
+        Атомарно подменяет набор правил. Дедупликация сохраняется по имени
+        правила, новые правила применяются ко всем инструментам в следующей пачке.
+        """
+        if rules.timeframe != self.timeframe:
+            raise ValueError(f"Rules for {rules.timeframe}m bars given to {self.timeframe}m engine")
+        if rules.lookback > LOOKBACK * self.timeframe:
+            raise ValueError(f"Rule lookback {rules.lookback} exceeds {LOOKBACK} bars")
+        if rules.indicators and self.indicators is None:
+            raise ValueError(f"Rules use indicators {sorted(rules.indicators)}, but none are attached")
+        self.rules = rules
+        self.check_all = True
+        if self.shadow is not None:
+            self.shadow.set_rules(rules)
+
+    def load_rules(self):
+        mtime = self.rules_path.stat().st_mtime
+        self.set_rules(RuleSet.from_file(self.rules_path, self.timeframe))
+        self.rules_mtime = mtime
+        print(f"Alert rules loaded for {self.timeframe}m: {', '.join(self.rules.names)}")
+
+    def reload_rules(self) -> bool:
+        """Перечитывает файл правил, если он изменился. При ошибке остаются старые правила."""
+        if self.rules_path is None:
+            return False
+        try:
+            if self.rules_path.stat().st_mtime == self.rules_mtime:
+                return False
+            self.load_rules()
+            return True
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Alert rules not reloaded: {e}")
+            return False
+
+    @staticmethod
+    def _lookup(state: dict, uids: pl.Series, dtype: pl.DataType) -> pl.Series:
+        return pl.Series([state.get(uid) for uid in uids], dtype=dtype)
+
+    def _update_daily_open(self, df: pl.DataFrame):
+        day = msk_date(pl.col("timestamp_utc"))
+        first_candle = (
+            df.sort(["uid", "timestamp_utc"])
+            .filter(day == day.max().over("uid"))
+            .group_by("uid")
+            .agg(day.first().alias("day"), pl.col("open").first())
+        )
+        stored = self._lookup(self.daily_open_date, first_candle["uid"], pl.Date)
+        new_day = first_candle.filter(stored.is_null() | (first_candle["day"] > stored))
+        self.daily_open_date.update(zip(new_day["uid"], new_day["day"]))
+        self.daily_open.update(zip(new_day["uid"], new_day["open"]))
 
+    def _evaluate(self, candles: pl.DataFrame) -> list[dict]:
+        """Считает все правила по всем инструментам кадра одним запросом Polars."""
+        rules = self.rules
+        if not rules.rules or candles.is_empty():
+            return []
+
+        self._update_daily_open(candles)
+
+        uids = candles["uid"].unique()
+        state = pl.DataFrame({
+            "uid": uids,
+            "daily_open": self._lookup(self.daily_open, uids, pl.Float64),
+            **{
+                f"last_alert_{i}": self._lookup(self.last_alert.get(name, {}), uids, TIMESTAMP_DTYPE)
+                for i, name in enumerate(rules.names)
+            },
+        })
+        if rules.indicators:
+            state = state.join(self.indicators.snapshot(uids), on="uid", how="left")
+
+        triggered = rules.plan(candles.lazy(), state.lazy()).with_columns(
+            rule=pl.col("rule").replace_strict(dict(enumerate(rules.names)), return_dtype=pl.Utf8)
+        ).collect()
+
+        for name, uid, timestamp_utc in zip(triggered["rule"], triggered["uid"],
+                                            triggered["timestamp_utc"]):
+            self.last_alert.setdefault(name, {})[uid] = timestamp_utc
+
+        return triggered.select(
+            "ticker",
+            "name",
+            "rule",
+            direction=pl.when(pl.col("change") >= 0)
+            .then(pl.lit("РОСТ"))
+            .otherwise(pl.lit("ПАДЕНИЕ")),
+            change_percent=(pl.col("change") * 100).round(2),
+            candle_close=pl.col("close"),
+            timestamp_utc=pl.col("timestamp_utc")
+            .dt.convert_time_zone(TARGET_TZ.key)
+            .dt.to_string("%Y-%m-%dT%H:%M:%S%:z"),
+        ).to_dicts()
 
     def analyze(self, df: pl.DataFrame) -> list[dict]:
-        recent_df = df.group_by("uid").tail(16).sort(["uid", "timestamp_utc"])
-
-        latest_candle = recent_df.group_by("uid").last()
-
-        last_1m_alert_list: list[dict] = []
-
-        for row in latest_candle.iter_rows(named=True):
-            uid = row["uid"]
-            ticker = row["ticker"]
-            name = row["name"]
-            candle_open = row["open"]
-            candle_close = row["close"]
-            timestamp_utc = row["timestamp_utc"]
-
-            if uid in self.last_1m_alert:
-                if timestamp_utc <= self.last_1m_alert[uid]:
-                    continue
-            change_1m = abs(candle_close - candle_open) / candle_open
-            if change_1m > 0.002:
-                self.last_1m_alert[uid] = timestamp_utc
-                if candle_open > candle_close:
-                    continue
-                alert_data = {
-                    "ticker": ticker,
-                    "name": name,
-                    "direction": "РОСТ",
-                    "change_percent": round(change_1m * 100, 2),
-                    "candle_close": candle_close,
-                    "timestamp_utc": timestamp_utc.astimezone(TARGET_TZ).isoformat()
-                }
-                last_1m_alert_list.append(alert_data)
-
-        return last_1m_alert_list
+        return self._evaluate(df)
+
+    def seed(self, df: pl.DataFrame, check: bool = True):
+        """
+        Загружает историю: цены открытия дня. Как и при полном проходе,
+        инструменты истории будут проверены при первом вызове analyze_batch,
+        если check=True.
+        """
+        if df.is_empty():
+            return
+        self._update_daily_open(df)
+        if check:
+            self.pending_uids |= set(df["uid"].unique())
+        if self.shadow is not None:
+            self.shadow.seed(df, check)
+
+    def analyze_batch(self, new_df: pl.DataFrame, store: CandleStore,
+                      full_df: pl.DataFrame | None = None) -> list[dict]:
+        """
+        Инкрементальный режим: проверяет лишь инструменты, попавшие в пачку
+        new_df, по их последним LOOKBACK барам из store, куда пачка уже
+        записана. Стоимость O(размер пачки). При verify=True результат
+        сверяется с analyze(full_df).
+        """
+        if self.check_all:
+            uids = store.uids
+        else:
+            uids = set(new_df["uid"].unique()) | self.pending_uids
+        self.pending_uids = set()
+        self.check_all = False
+
+        alert_list = self._evaluate(store.to_frame(last_n=LOOKBACK, uids=uids))
+
+        if self.shadow is not None and full_df is not None:
+            self._compare(alert_list, self.shadow.analyze(full_df))
+
+        return alert_list
+
+    @staticmethod
+    def _compare(incremental: list[dict], full_scan: list[dict]):
+        def key(alert: dict) -> tuple:
+            return alert["rule"], alert["ticker"], alert["timestamp_utc"]
+
+        incremental_keys = {key(x) for x in incremental}
+        full_scan_keys = {key(x) for x in full_scan}
+        if incremental_keys != full_scan_keys:
+            print(f"AlertEngine mismatch\n"
+                  f"Only incremental: {sorted(incremental_keys - full_scan_keys)}\n"
+                  f"Only full scan: {sorted(full_scan_keys - incremental_keys)}\n")
@@ -0,0 +1,192 @@
+import json
+import operator
+from dataclasses import dataclass
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from indicators import INDICATOR_COLUMNS
+from timeframes import TIMEFRAMES
+
+
+TARGET_TZ = ZoneInfo("Europe/Moscow")
+
+DIRECTIONS = ("up", "down", "both")
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+FILTER_COLUMNS = ("close", *INDICATOR_COLUMNS)
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    """
+    Правило алерта из конфигурации.
+
+    timeframe - по каким барам считается правило (1, 5, 15, 30 или 60 минут).
+    lookback - окно в минутах (цена отсчета - open первой свечи окна)
+    или "day" (цена отсчета - open первой свечи торгового дня).
+    cooldown - сколько минут после алерта правило молчит по инструменту,
+    0 - не чаще одного раза на свечу, "day" - раз в торговый день.
+    filters - дополнительные условия [колонка, оператор, число или колонка],
+    например ["rsi_14", "<", 70] или ["close", ">", "ema_50"].
+    """
+    name: str
+    threshold_percent: float
+    lookback: int | str = 1
+    direction: str = "up"
+    cooldown: int | str = 0
+    filters: tuple = ()
+    timeframe: int = 1
+    enabled: bool = True
+
+    def __post_init__(self):
+        if self.threshold_percent <= 0:
+            raise ValueError(f"Rule {self.name}: threshold_percent must be positive")
+        if self.timeframe not in TIMEFRAMES:
+            raise ValueError(f"Rule {self.name}: timeframe must be one of {TIMEFRAMES}")
+        if self.direction not in DIRECTIONS:
+            raise ValueError(f"Rule {self.name}: direction must be one of {DIRECTIONS}")
+        if self.lookback != "day" and not (isinstance(self.lookback, int) and self.lookback >= 1):
+            raise ValueError(f"Rule {self.name}: lookback must be minutes >= 1 or 'day'")
+        if self.cooldown != "day" and not (isinstance(self.cooldown, int) and self.cooldown >= 0):
+            raise ValueError(f"Rule {self.name}: cooldown must be minutes >= 0 or 'day'")
+        for column, op, value in self.filters:
+            if column not in FILTER_COLUMNS or op not in OPERATORS:
+                raise ValueError(f"Rule {self.name}: bad filter {[column, op, value]}")
+            if isinstance(value, str) and value not in FILTER_COLUMNS:
+                raise ValueError(f"Rule {self.name}: unknown filter column {value}")
+
+    @property
+    def indicators(self) -> set[str]:
+        columns = set()
+        for column, _, value in self.filters:
+            columns |= {column, value} & set(INDICATOR_COLUMNS)
+        return columns
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AlertRule":
+        valid_keys = cls.__annotations__.keys()
+        unknown = set(data) - set(valid_keys)
+        if unknown:
+            raise ValueError(f"Unknown rule fields: {sorted(unknown)}")
+        data = dict(data)
+        data["filters"] = tuple(tuple(x) for x in data.get("filters", ()))
+        return cls(**data)
+
+
+DEFAULT_RULES = [
+    AlertRule(name="rise_1m", threshold_percent=0.2, lookback=1, direction="up", cooldown=0),
+]
+
+
+def msk_date(expr: pl.Expr) -> pl.Expr:
+    return expr.dt.convert_time_zone(TARGET_TZ.key).dt.date()
+
+
+class RuleSet:
+    """
+    Набор правил, скомпилированный в один ленивый запрос Polars:
+    все правила считаются для всех инструментов за один проход по кадру.
+    """
+
+    def __init__(self, rules: list[AlertRule], timeframe: int = 1):
+        names = [rule.name for rule in rules]
+        if len(names) != len(set(names)):
+            raise ValueError("Rule names must be unique")
+        self.timeframe = timeframe
+        self.rules = [rule for rule in rules if rule.enabled and rule.timeframe == timeframe]
+        self.names = [rule.name for rule in self.rules]
+
+    @classmethod
+    def from_file(cls, path: Path, timeframe: int = 1) -> "RuleSet":
+        with Path(path).open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls([AlertRule.from_dict(x) for x in data["rules"]], timeframe)
+
+    @property
+    def lookback(self) -> int:
+        """Сколько последних минут истории нужно правилам."""
+        return max(
+            [rule.lookback for rule in self.rules if rule.lookback != "day"],
+            default=1,
+        )
+
+    @property
+    def indicators(self) -> set[str]:
+        """Индикаторы, на которые ссылаются фильтры правил."""
+        return set().union(*(rule.indicators for rule in self.rules))
+
+    def _reference(self, i: int, rule: AlertRule) -> pl.Expr:
+        if rule.lookback == "day":
+            return pl.col("daily_open")
+        return pl.col(f"reference_{i}")
+
+    def _ready(self, i: int, rule: AlertRule) -> pl.Expr:
+        ts = pl.col("timestamp_utc")
+        last_alert = pl.col(f"last_alert_{i}")
+        if rule.cooldown == "day":
+            return last_alert.is_null() | (msk_date(last_alert) < msk_date(ts))
+        return last_alert.is_null() | (ts > last_alert + pl.duration(minutes=rule.cooldown))
+
+    def _crossed(self, rule: AlertRule, change: pl.Expr) -> pl.Expr:
+        threshold = rule.threshold_percent / 100
+        if rule.direction == "up":
+            crossed = change > threshold
+        elif rule.direction == "down":
+            crossed = change < -threshold
+        else:
+            crossed = change.abs() > threshold
+
+        for column, op, value in rule.filters:
+            other = pl.col(value) if isinstance(value, str) else pl.lit(value)
+            crossed = crossed & OPERATORS[op](pl.col(column), other)
+        return crossed
+
+    def plan(self, candles: pl.LazyFrame, state: pl.LazyFrame) -> pl.LazyFrame:
+        """
+        candles - свечи в формате SCHEMA, state - по строке на uid с колонками
+        daily_open, last_alert_<i> для каждого правила и индикаторами из фильтров.
+        Возвращает по строке на каждое сработавшее (uid, правило).
+        """
+        ts = pl.col("timestamp_utc")
+        aggs = [
+            pl.col("ticker").first(),
+            pl.col("name").first(),
+            pl.col("close").last(),
+            ts.last(),
+        ]
+        for i, rule in enumerate(self.rules):
+            if rule.lookback != "day":
+                aggs.append(
+                    pl.col("open")
+                    .filter(ts > ts.last() - pl.duration(minutes=rule.lookback))
+                    .first()
+                    .alias(f"reference_{i}")
+                )
+
+        hits = []
+        for i, rule in enumerate(self.rules):
+            reference = self._reference(i, rule)
+            change = (pl.col("close") - reference) / reference
+            hits.append(
+                pl.when(self._ready(i, rule) & self._crossed(rule, change))
+                .then(pl.struct(rule=pl.lit(i, dtype=pl.UInt32), change=change))
+            )
+
+        return (
+            candles.sort(["uid", "timestamp_utc"])
+            .group_by("uid")
+            .agg(aggs)
+            .join(state, on="uid", how="left")
+            .with_columns(hit=pl.concat_list(hits).list.drop_nulls())
+            .explode("hit")
+            .filter(pl.col("hit").is_not_null())
+            .unnest("hit")
+        )
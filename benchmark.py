@@ -0,0 +1,250 @@
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from config import BENCHMARK_DIR, CANDLE_WINDOW, ALERT_TIMEFRAMES
+from alert_engine import LOOKBACK
+from candle_store import CandleStore, frame_from_columns
+from candle_decoder import decode_candles
+from history_loader import stitch
+from timeframes import TimeframeAggregator
+from stream_replay import Candle, Quotation
+from price_change_signal import analyze_candles, build_engines
+
+
+# Основная сессия Мосбиржи 10:00-19:00 МСК
+SESSION_START = timedelta(hours=7)
+SESSION_MINUTES = 540
+LAST_DAY = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+CASES = ("frame_build", "store_extend", "engine_seed", "analyze", "tick_incremental", "tick_full")
+
+
+def synthetic_history(instruments: int, days: int, session_minutes: int = SESSION_MINUTES,
+                      seed: int = 0) -> pl.DataFrame:
+    """
+    Минутные свечи SCHEMA: instruments инструментов, days торговых сессий
+    по session_minutes минут, цены - случайное блуждание. Строки по времени,
+    внутри минуты по инструменту, как после stitch.
+    """
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(session_minutes, dtype=np.int64) * 60_000_000
+    day_starts = [
+        int((LAST_DAY - timedelta(days=days - 1 - d) + SESSION_START).timestamp()) * 1_000_000
+        for d in range(days)
+    ]
+    ts = np.concatenate([start + minutes for start in day_starts])
+    shape = (len(ts), instruments)
+
+    base = rng.uniform(10.0, 1000.0, instruments)
+    close = base * np.exp(np.cumsum(rng.normal(0.0, 0.001, shape), axis=0))
+    open_ = np.vstack([close[:1], close[:-1]])
+    spread = np.abs(rng.normal(0.0, 0.0005, shape))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+
+    idx = np.tile(np.arange(instruments), len(ts))
+    tickers = pl.Series([f"T{i:05d}" for i in range(instruments)])
+    return frame_from_columns({
+        "ticker": tickers.gather(idx),
+        "uid": pl.Series([f"uid-{i:05d}" for i in range(instruments)]).gather(idx),
+        "name": tickers.gather(idx),
+        "open": open_.ravel(),
+        "high": high.ravel(),
+        "low": low.ravel(),
+        "close": close.ravel(),
+        "volume": rng.integers(1, 1000, shape).ravel(),
+        "timestamp_utc": np.repeat(ts, instruments),
+    })
+
+
+def _quotation(x: float) -> Quotation:
+    units = int(x)
+    return Quotation(units, round((x - units) * 1e9))
+
+
+def synthetic_response(df: pl.DataFrame) -> list[Candle]:
+    """Свечи одного инструмента в виде ответа get_candles."""
+    return [
+        Candle(uid, _quotation(o), _quotation(h), _quotation(l), _quotation(c), v, ts)
+        for uid, o, h, l, c, v, ts in df.select(
+            "uid", "open", "high", "low", "close", "volume", "timestamp_utc"
+        ).iter_rows()
+    ]
+
+
+def measure(fn, repeat: int) -> dict:
+    """Время fn() в мс: прогрев и repeat замеров."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+    }
+
+
+def bench_frame_build(instruments: int, session_minutes: int, repeat: int) -> dict:
+    """Сборка кадра minute_candles_to_dataframe: decode_candles по окну на инструмент и stitch."""
+    one = synthetic_history(1, 1, session_minutes)
+    candles = synthetic_response(one)
+
+    def build():
+        return stitch([
+            decode_candles(candles, f"T{i:05d}", f"uid-{i:05d}", f"T{i:05d}")
+            for i in range(instruments)
+        ])
+
+    return {"rows": instruments * len(candles), **measure(build, repeat)}
+
+
+def bench_universe(instruments: int, days: int, session_minutes: int, repeat: int,
+                   cases: tuple) -> list[dict]:
+    ticks = 2 * (repeat + 1)
+    df = synthetic_history(instruments, days, session_minutes)
+    last = df["timestamp_utc"].unique().sort()
+    history = df.filter(pl.col("timestamp_utc") < last[-ticks])
+    batches = df.filter(pl.col("timestamp_utc") >= last[-ticks]).partition_by(
+        "timestamp_utc", maintain_order=True
+    )
+    del df
+    results = []
+
+    def add(case: str, rows: int, timing: dict):
+        results.append({"case": case, "instruments": instruments, "days": days, "rows": rows, **timing})
+        print(f"{case:<17} {instruments:>6} {days:>4} {rows:>10} "
+              f"{timing['median_ms']:>10.1f} {timing['min_ms']:>10.1f}")
+
+    if "store_extend" in cases:
+        add("store_extend", history.height, measure(
+            lambda: CandleStore(window=CANDLE_WINDOW, capacity=instruments).extend(history), repeat
+        ))
+
+    store = CandleStore(window=CANDLE_WINDOW, capacity=instruments)
+    store.extend(history)
+    del history
+
+    if "engine_seed" in cases:
+        add("engine_seed", len(store), measure(
+            lambda: build_engines(store, TimeframeAggregator(ALERT_TIMEFRAMES)), repeat
+        ))
+
+    aggregator = TimeframeAggregator(ALERT_TIMEFRAMES)
+    engines, stores = build_engines(store, aggregator)
+
+    if "analyze" in cases:
+        frame = store.to_frame(last_n=LOOKBACK)
+        add("analyze", frame.height, measure(lambda: engines[1].analyze(frame), repeat))
+
+    # Каждый замер тика получает следующую минуту
+    for case, incremental in (("tick_incremental", True), ("tick_full", False)):
+        batch_iter = iter(batches[:repeat + 1] if incremental else batches[repeat + 1:])
+        if case in cases:
+            add(case, instruments, measure(
+                lambda: analyze_candles(next(batch_iter), stores, engines, aggregator, incremental),
+                repeat,
+            ))
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: list[dict], previous_path: Path) -> str:
+    previous = json.loads(previous_path.read_text())
+    before = {(x["case"], x["instruments"], x["days"]): x for x in previous["results"]}
+    lines = [f"Compared with {previous_path.name} ({previous.get('git') or '-'}):"]
+    for x in current:
+        old = before.get((x["case"], x["instruments"], x["days"]))
+        if old is None:
+            continue
+        ratio = x["median_ms"] / old["median_ms"] if old["median_ms"] else float("nan")
+        lines.append(
+            f"{x['case']:<17} {x['instruments']:>6} {x['days']:>4} "
+            f"{old['median_ms']:>10.1f} -> {x['median_ms']:>10.1f} ms  x{ratio:.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры горячего пути: декодирование, хранилище, AlertEngine")
+    parser.add_argument("--instruments", default="100,1000,5000")
+    parser.add_argument("--days", default="1,7,30")
+    parser.add_argument("--session-minutes", type=int, default=SESSION_MINUTES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--max-rows", type=int, default=20_000_000,
+                        help="пропускать сочетания с большим числом свечей истории")
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="прошлый JSON для сравнения")
+    args = parser.parse_args()
+
+    instruments = [int(x) for x in args.instruments.split(",")]
+    days = [int(x) for x in args.days.split(",")]
+    cases = tuple(x for x in args.cases.split(",") if x)
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases {sorted(unknown)}, expected {CASES}")
+
+    started = datetime.now(timezone.utc)
+    print(f"{'Case':<17} {'Inst':>6} {'Days':>4} {'Rows':>10} {'Median ms':>10} {'Min ms':>10}")
+    results = []
+    for n in instruments:
+        if "frame_build" in cases:
+            timing = bench_frame_build(n, args.session_minutes, args.repeat)
+            rows = timing.pop("rows")
+            results.append({"case": "frame_build", "instruments": n, "days": 1, "rows": rows, **timing})
+            print(f"{'frame_build':<17} {n:>6} {1:>4} {rows:>10} "
+                  f"{timing['median_ms']:>10.1f} {timing['min_ms']:>10.1f}")
+        for d in days:
+            if n * d * args.session_minutes > args.max_rows:
+                print(f"Skip {n} instruments x {d} days: more than {args.max_rows} rows")
+                continue
+            results.extend(bench_universe(n, d, args.session_minutes, args.repeat, cases))
+
+    report = {
+        "started": started.isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "numpy": np.__version__,
+        "params": {
+            "session_minutes": args.session_minutes,
+            "candle_window": CANDLE_WINDOW,
+            "lookback": LOOKBACK,
+            "timeframes": list(ALERT_TIMEFRAMES),
+        },
+        "results": results,
+    }
+    out = args.out or BENCHMARK_DIR / f"bench-{started:%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"Saved {out}")
+
+    if args.compare is not None:
+        print(compare(results, args.compare))
+
+
+if __name__ == "__main__":
+    main()
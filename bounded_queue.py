@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+from collections import OrderedDict
+
+
+QUEUE_POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class BoundedQueue(asyncio.Queue):
+    """
+    asyncio.Queue с ограничением и политикой переполнения:
+    block - put ждет свободного места, drop_oldest - выбрасывается самый
+    старый элемент, coalesce - элемент с тем же ключом key(item) удаляется,
+    а новый встает в конец очереди (порядок выдачи совпадает с порядком
+    поступления), без ключа при переполнении новый элемент сливается с
+    последним в очереди функцией merge(last, new).
+    Глубина, максимум глубины, выброшенные и слитые элементы считаются.
+    """
+
+    def __init__(self, maxsize: int, policy: str = "block", name: str = "",
+                 key=None, merge=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Queue {name}: policy must be one of {QUEUE_POLICIES}")
+        if policy == "coalesce" and key is None and merge is None:
+            raise ValueError(f"Queue {name}: coalesce policy needs key or merge")
+        self.policy = policy
+        self.name = name
+        self.key = key if policy == "coalesce" else None
+        self.merge = merge if policy == "coalesce" else None
+        self.puts = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        # Элементы без ключа получают уникальный номер
+        self._queue = OrderedDict()
+        self._seq = itertools.count()
+
+    def _slot(self, item):
+        key = self.key(item) if self.key is not None else None
+        return ("seq", next(self._seq)) if key is None else ("key", key)
+
+    def _put(self, item):
+        self._queue[self._slot(item)] = item
+
+    def _get(self):
+        return self._queue.popitem(last=False)[1]
+
+    def _coalesce(self, item) -> bool:
+        if self.key is not None:
+            key = self.key(item)
+            if key is not None and ("key", key) in self._queue:
+                self._queue[("key", key)] = item
+                self._queue.move_to_end(("key", key))
+                self.coalesced += 1
+                return True
+        if self.merge is not None and self.full() and self._queue:
+            last = next(reversed(self._queue))
+            self._queue[last] = self.merge(self._queue[last], item)
+            self.coalesced += 1
+            return True
+        return False
+
+    def put_nowait(self, item):
+        self.puts += 1
+        if self.policy == "coalesce" and self._coalesce(item):
+            return
+        if self.policy == "drop_oldest" and self.full():
+            self.get_nowait()
+            self.task_done()
+            self.dropped += 1
+        super().put_nowait(item)
+        self.high_water = max(self.high_water, self.qsize())
+
+    async def put(self, item):
+        if self.policy == "drop_oldest":
+            return self.put_nowait(item)
+        if self.policy == "coalesce" and self._coalesce(item):
+            self.puts += 1
+            return
+        return await super().put(item)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "policy": self.policy,
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "high_water": self.high_water,
+            "puts": self.puts,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+def queues_report(queues: list[dict]) -> str:
+    lines = [
+        f"{'Queue':<12} {'Policy':<11} {'Depth':>6} {'Max':>6} {'HWM':>6} "
+        f"{'Puts':>8} {'Dropped':>7} {'Merged':>7}"
+    ]
+    for q in queues:
+        lines.append(
+            f"{q['name']:<12} {q['policy']:<11} {q['depth']:>6} {q['maxsize']:>6} {q['high_water']:>6} "
+            f"{q['puts']:>8} {q['dropped']:>7} {q['coalesced']:>7}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+
+from candle_store import SCHEMA, frame_from_columns
+
+
+PRICE_COLUMNS = ("open", "high", "low", "close")
+NANO = 1e9
+
+# Порядок целочисленных полей свечи в буфере декодера
+_FIELDS = (
+    *(f"{column}_{part}" for column in PRICE_COLUMNS for part in ("units", "nano")),
+    "volume",
+    "is_complete",
+)
+_WIDTH = len(_FIELDS)
+_VOLUME = _FIELDS.index("volume")
+_COMPLETE = _FIELDS.index("is_complete")
+
+
+def quotations_to_float(units: np.ndarray, nano: np.ndarray) -> np.ndarray:
+    """Цены Quotation из колонок units и nano."""
+    return units + nano / NANO
+
+
+def decode_candles(candles, ticker: str, uid: str, name: str) -> pl.DataFrame:
+    """
+    Переводит свечи ответа get_candles в кадр SCHEMA без словаря на свечу.
+    За один проход поля units/nano, объем и время складываются в плоские
+    буферы, цены считаются векторно, незакрытые свечи отбрасываются маской.
+    """
+    fields = []
+    extend = fields.extend
+    times = []
+    add_time = times.append
+    timestamp = datetime.timestamp
+    for c in candles:
+        o, h, l, cl = c.open, c.high, c.low, c.close
+        extend((
+            o.units, o.nano, h.units, h.nano, l.units, l.nano, cl.units, cl.nano,
+            c.volume, c.is_complete,
+        ))
+        add_time(timestamp(c.time))
+
+    raw = np.array(fields, dtype=np.int64).reshape(-1, _WIDTH)
+    complete = raw[:, _COMPLETE].astype(bool)
+    raw = raw[complete]
+    n = len(raw)
+    if not n:
+        return pl.DataFrame(schema=SCHEMA)
+
+    columns = {
+        "ticker": pl.repeat(ticker, n, eager=True),
+        "uid": pl.repeat(uid, n, eager=True),
+        "name": pl.repeat(name, n, eager=True),
+    }
+    return _numeric_frame(columns, raw, np.array(times)[complete])
+
+
+def _numeric_frame(columns: dict, raw: np.ndarray, times: np.ndarray) -> pl.DataFrame:
+    for i, column in enumerate(PRICE_COLUMNS):
+        columns[column] = quotations_to_float(raw[:, 2 * i], raw[:, 2 * i + 1])
+    columns["volume"] = raw[:, _VOLUME]
+    # Секунды в float64 точны до микросекунды на всем диапазоне дат API
+    columns["timestamp_utc"] = np.rint(times * 1e6).astype(np.int64)
+    return frame_from_columns(columns)
+
+
+class InstrumentTable:
+    """Справочник инструментов с целочисленными индексами: uid -> номер строки."""
+
+    def __init__(self, shares: dict):
+        self.index = {uid: i for i, uid in enumerate(shares)}
+        self.uids = pl.Series("uid", list(shares), dtype=pl.Utf8)
+        self.tickers = pl.Series("ticker", [x["ticker"] for x in shares.values()], dtype=pl.Utf8)
+        self.names = pl.Series("name", [x["name"] for x in shares.values()], dtype=pl.Utf8)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def columns(self, idx: np.ndarray) -> dict:
+        return {
+            "ticker": self.tickers.gather(idx),
+            "uid": self.uids.gather(idx),
+            "name": self.names.gather(idx),
+        }
+
+
+class StreamDecoder:
+    """
+    Копит свечи из market_data_stream в заранее выделенных массивах
+    (номер инструмента, units/nano цен, объем, время) и отдает пачку
+    одним кадром SCHEMA. Словарь на свечу не создается.
+    """
+
+    def __init__(self, instruments: InstrumentTable, capacity: int | None = None):
+        self.instruments = instruments
+        capacity = capacity or max(64, len(instruments))
+        self._idx = np.empty(capacity, dtype=np.int64)
+        self._raw = np.empty((capacity, _WIDTH), dtype=np.int64)
+        self._times = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def _grow(self):
+        capacity = 2 * len(self._idx)
+        self._idx = np.resize(self._idx, capacity)
+        self._raw = np.resize(self._raw, (capacity, _WIDTH))
+        self._times = np.resize(self._times, capacity)
+
+    def add(self, candle) -> bool:
+        """Добавляет свечу потока. Свечи неизвестных инструментов пропускаются."""
+        i = self.instruments.index.get(candle.instrument_uid)
+        if i is None:
+            return False
+        if self.size == len(self._idx):
+            self._grow()
+        n = self.size
+        o, h, l, cl = candle.open, candle.high, candle.low, candle.close
+        self._idx[n] = i
+        self._raw[n] = (
+            o.units, o.nano, h.units, h.nano, l.units, l.nano, cl.units, cl.nano,
+            candle.volume, 1,
+        )
+        self._times[n] = candle.time.timestamp()
+        self.size = n + 1
+        return True
+
+    def take(self) -> pl.DataFrame:
+        """Отдает накопленную пачку и начинает новую в тех же массивах."""
+        n = self.size
+        self.size = 0
+        if not n:
+            return pl.DataFrame(schema=SCHEMA)
+        columns = self.instruments.columns(self._idx[:n])
+        # Копия: массивы переиспользуются следующей пачкой
+        return _numeric_frame(columns, self._raw[:n].copy(), self._times[:n].copy())
@@ -0,0 +1,186 @@
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import polars as pl
+
+
+SCHEMA = {
+    "ticker": pl.Utf8,
+    "uid": pl.Utf8,
+    "name": pl.Utf8,
+    "open": pl.Float64,
+    "high": pl.Float64,
+    "low": pl.Float64,
+    "close": pl.Float64,
+    "volume": pl.Int64,
+    "timestamp_utc": pl.Datetime(time_unit="us", time_zone="UTC")
+}
+
+NUMERIC_COLUMNS = {
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+    "timestamp_utc": np.int64,
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_US = timedelta(microseconds=1)
+
+
+def frame_from_columns(columns: dict) -> pl.DataFrame:
+    """Кадр SCHEMA из колонок, где timestamp_utc - микросекунды от эпохи."""
+    df = pl.DataFrame(columns)
+    return df.with_columns(
+        pl.col("timestamp_utc").cast(SCHEMA["timestamp_utc"])
+    ).select(SCHEMA.keys())
+
+
+class CandleStore:
+    """
+    Хранит последние `window` минутных свечей для каждого uid.
+
+    Каждая числовая колонка SCHEMA - двумерный кольцевой буфер
+    (инструмент x window), pos - позиция следующей записи инструмента.
+    Пачка свечей записывается и читается одной векторной выборкой
+    по индексам слот * window + позиция, без цикла по инструментам.
+    """
+
+    def __init__(self, window: int = 1440, capacity: int = 256):
+        self.window = window
+        self._capacity = capacity
+        self._slots: dict[str, int] = {}
+        self._tickers: list[str] = []
+        self._uids: list[str] = []
+        self._names: list[str] = []
+        self._pos = np.zeros(capacity, dtype=np.int64)
+        self._count = np.zeros(capacity, dtype=np.int64)
+        self._columns = {
+            column: np.zeros((capacity, window), dtype=dtype)
+            for column, dtype in NUMERIC_COLUMNS.items()
+        }
+
+    def __len__(self) -> int:
+        return int(self._count[:len(self._uids)].sum())
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._slots
+
+    @property
+    def uids(self) -> list[str]:
+        return list(self._uids)
+
+    def last_timestamp(self, uid: str) -> datetime | None:
+        slot = self._slots.get(uid)
+        if slot is None or not self._count[slot]:
+            return None
+        last_us = int(self._columns["timestamp_utc"][slot, (self._pos[slot] - 1) % self.window])
+        return EPOCH + last_us * ONE_US
+
+    def _grow(self, needed: int):
+        capacity = max(1, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        self._pos = np.resize(self._pos, capacity)
+        self._count = np.resize(self._count, capacity)
+        self._pos[self._capacity:] = 0
+        self._count[self._capacity:] = 0
+        for column, arr in self._columns.items():
+            grown = np.zeros((capacity, self.window), dtype=arr.dtype)
+            grown[:self._capacity] = arr
+            self._columns[column] = grown
+        self._capacity = capacity
+
+    def _register(self, df: pl.DataFrame):
+        """Выдает слоты инструментам кадра, которых еще нет в хранилище."""
+        new = df.filter(~pl.col("uid").is_in(list(self._slots))).unique("uid", keep="first", maintain_order=True)
+        if new.is_empty():
+            return
+        if len(self._uids) + new.height > self._capacity:
+            self._grow(len(self._uids) + new.height)
+        for uid, ticker, name in new.select("uid", "ticker", "name").iter_rows():
+            self._slots[uid] = len(self._uids)
+            self._uids.append(uid)
+            self._tickers.append(ticker)
+            self._names.append(name)
+
+    def extend(self, df: pl.DataFrame) -> int:
+        """
+        Добавляет кадр в формате SCHEMA: историю или минутную пачку.
+        Свечи не новее последней сохраненной у инструмента отбрасываются.
+        """
+        if df.is_empty():
+            return 0
+
+        self._register(df)
+        df = (
+            df.with_columns(_slot=pl.col("uid").replace_strict(self._slots, return_dtype=pl.Int64))
+            .sort(["_slot", "timestamp_utc"], maintain_order=True)
+            .unique(subset=["_slot", "timestamp_utc"], keep="last", maintain_order=True)
+        )
+        window = self.window
+        slots = df["_slot"].to_numpy()
+        ts = df["timestamp_utc"].dt.epoch("us").to_numpy()
+
+        # Время последней свечи каждого слота, у пустых - меньше любого
+        last_ts = self._columns["timestamp_utc"][slots, (self._pos[slots] - 1) % window]
+        fresh = (self._count[slots] == 0) | (ts > last_ts)
+        if not fresh.all():
+            df = df.filter(pl.Series(fresh))
+            slots = slots[fresh]
+            ts = ts[fresh]
+        total = len(slots)
+        if not total:
+            return 0
+
+        # Номер строки внутри своего слота; из длинной истории - последние window
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+        sizes = np.diff(np.r_[starts, total])
+        rank = np.arange(total) - np.repeat(starts, sizes)
+        skip = np.repeat(np.maximum(sizes - window, 0), sizes)
+        keep = rank >= skip
+        group_slots = slots[starts]
+        idx = (np.repeat(self._pos[group_slots], sizes) + rank - skip)[keep] % window
+        rows = slots[keep]
+
+        for column, arr in self._columns.items():
+            values = ts if column == "timestamp_utc" else df[column].to_numpy()
+            arr[rows, idx] = values[keep]
+
+        kept = np.minimum(sizes, window)
+        self._pos[group_slots] = (self._pos[group_slots] + kept) % window
+        self._count[group_slots] = np.minimum(self._count[group_slots] + kept, window)
+        return int(kept.sum())
+
+    def to_frame(self, last_n: int | None = None, uids=None) -> pl.DataFrame:
+        """
+        Собирает кадр в формате SCHEMA из последних last_n свечей каждого
+        инструмента (или только перечисленных uids) одной векторной выборкой.
+        Строки упорядочены по инструменту и времени.
+        """
+        if uids is None:
+            slots = np.arange(len(self._uids))
+        else:
+            slots = np.fromiter(
+                (self._slots[uid] for uid in uids if uid in self._slots), dtype=np.int64
+            )
+        counts = self._count[slots]
+        n = counts if last_n is None else np.minimum(counts, last_n)
+        total = int(n.sum())
+        if not total:
+            return pl.DataFrame(schema=SCHEMA)
+
+        slot_idx = np.repeat(slots, n)
+        starts = self._pos[slots] - n
+        offsets = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+        flat_idx = slot_idx * self.window + (np.repeat(starts, n) + offsets) % self.window
+
+        columns = {
+            "ticker": pl.Series(self._tickers).gather(slot_idx),
+            "uid": pl.Series(self._uids).gather(slot_idx),
+            "name": pl.Series(self._names).gather(slot_idx),
+        }
+        for column, arr in self._columns.items():
+            columns[column] = pl.Series(column, arr.ravel()[flat_idx])
+        return frame_from_columns(columns)
@@ -0,0 +1,54 @@
+import time as _time
+from datetime import datetime, timezone
+
+
+class SystemClock:
+    def time(self) -> float:
+        return _time.time()
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time(), timezone.utc)
+
+    def timeout(self, seconds: float | None) -> float | None:
+        return seconds
+
+    def received(self, df):
+        pass
+
+    def analyzed(self, minute: datetime):
+        pass
+
+
+# Часы пайплайна. Воспроизведение записанной сессии подменяет их,
+# чтобы дедлайны минут и задержки этапов считались во времени записи
+_clock = SystemClock()
+
+
+def set_clock(clock):
+    global _clock
+    _clock = clock
+
+
+def time() -> float:
+    """Текущее unix-время пайплайна, секунды."""
+    return _clock.time()
+
+
+def now() -> datetime:
+    """Текущее время пайплайна в UTC."""
+    return _clock.now()
+
+
+def timeout(seconds: float | None) -> float | None:
+    """Сколько реальных секунд ждать, чтобы по часам пайплайна прошло seconds."""
+    return _clock.timeout(seconds)
+
+
+def received(df):
+    """Пачка свечей потока принята в сборку минут."""
+    _clock.received(df)
+
+
+def analyzed(minute: datetime):
+    """Свечи по минуту minute включительно прошли анализ."""
+    _clock.analyzed(minute)
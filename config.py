@@ -5,6 +5,110 @@ from pathlib import Path
 load_dotenv()
 
 INVEST_TOKEN = os.getenv("INVEST_TOKEN")
+# Адрес gRPC API, пусто - боевой. Для fake_invest_server.py: localhost:8443
+# и GRPC_DEFAULT_SSL_ROOTS_FILE_PATH с его самоподписанным сертификатом
+INVEST_TARGET = os.getenv("INVEST_TARGET") or None
 DATA_DIR_NAME = os.getenv("DATA_DIR")
 
 data_path = Path(os.path.join(os.path.curdir, DATA_DIR_NAME))
+
+# Сколько минутных свечей на инструмент держит CandleStore
+CANDLE_WINDOW = int(os.getenv("CANDLE_WINDOW", "1440"))
+
+# Инкрементальный AlertEngine (только инструменты из текущей пачки)
+# и сверка его результатов с полным проходом
+ALERT_ENGINE_INCREMENTAL = os.getenv("ALERT_ENGINE_INCREMENTAL", "1") == "1"
+ALERT_ENGINE_VERIFY = os.getenv("ALERT_ENGINE_VERIFY", "0") == "1"
+
+# Правила алертов, файл перечитывается на лету при изменении
+ALERT_RULES_PATH = Path(os.getenv("ALERT_RULES_PATH", "alert_rules.json"))
+
+# Старшие таймфреймы (минуты), которые собираются из минутного потока
+ALERT_TIMEFRAMES = tuple(
+    int(x) for x in os.getenv("ALERT_TIMEFRAMES", "5,15,30,60").split(",") if x
+)
+
+# Локальная история минутных свечей в Parquet
+HISTORY_DIR = data_path / "candles"
+HISTORY_BUCKETS = int(os.getenv("HISTORY_BUCKETS", "16"))
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "60"))
+
+# Шардирование подписки: сколько потоков market_data_stream открыть,
+# запускать ли каждый в отдельном процессе и сколько пачек свечей
+# может ждать анализа в общем канале
+STREAM_SHARDS = int(os.getenv("STREAM_SHARDS", "1"))
+STREAM_SHARD_PROCESSES = os.getenv("STREAM_SHARD_PROCESSES", "0") == "1"
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+
+# Политики переполнения очередей пайплайна: block, drop_oldest или coalesce
+# (в очереди сообщений потока - последняя свеча на uid, в очереди пачек -
+# новая пачка сливается с последней, по uid остается последняя свеча)
+STREAM_QUEUE_POLICY = os.getenv("STREAM_QUEUE_POLICY", "block")
+STREAM_METADATA_QUEUE_SIZE = int(os.getenv("STREAM_METADATA_QUEUE_SIZE", "10000"))
+STREAM_METADATA_POLICY = os.getenv("STREAM_METADATA_POLICY", "block")
+STREAM_REPORT_SECONDS = float(os.getenv("STREAM_REPORT_SECONDS", "300"))
+
+# Сборка минутных пачек: декодер потока отдает свечи после паузы
+# STREAM_DECODE_LINGER секунд, минута уходит на анализ, когда пришли свечи
+# всех инструментов, торговавшихся за BATCH_ACTIVE_MINUTES минут, или
+# через BATCH_DEADLINE_SECONDS секунд после закрытия минуты
+STREAM_DECODE_LINGER = float(os.getenv("STREAM_DECODE_LINGER", "0.05"))
+BATCH_DEADLINE_SECONDS = float(os.getenv("BATCH_DEADLINE_SECONDS", "3"))
+BATCH_ACTIVE_MINUTES = int(os.getenv("BATCH_ACTIVE_MINUTES", "5"))
+
+# Порт /metrics процесса сигналов (формат Prometheus), 0 - не поднимать
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Каталог записи сессии (ответы market_data_stream и get_candles) для
+# последующего воспроизведения stream_replay.py, пусто - не записывать
+STREAM_RECORD_DIR = os.getenv("STREAM_RECORD_DIR", "")
+
+# Результаты benchmark.py, по JSON на запуск
+BENCHMARK_DIR = data_path / "benchmarks"
+
+# Публикация алертов в RabbitMQ: сколько сообщений ждут подтверждения
+# брокера одновременно, слать ли алерты минуты одним сообщением-списком,
+# сколько раз повторять неподтвержденное и сколько ждать подтверждения.
+# Отложенные после всех повторов сообщения переотправляются в фоне с паузой
+# от RABBIT_PARKED_RETRY до RABBIT_PARKED_RETRY_MAX секунд, отложенных
+# хранится не больше RABBIT_PARKED_MAX, сверх этого выбрасываются самые старые
+RABBIT_PUBLISH_WINDOW = int(os.getenv("RABBIT_PUBLISH_WINDOW", "64"))
+RABBIT_PUBLISH_BATCH = os.getenv("RABBIT_PUBLISH_BATCH", "0") == "1"
+RABBIT_PUBLISH_RETRIES = int(os.getenv("RABBIT_PUBLISH_RETRIES", "3"))
+RABBIT_CONFIRM_TIMEOUT = float(os.getenv("RABBIT_CONFIRM_TIMEOUT", "10"))
+RABBIT_PARKED_RETRY = float(os.getenv("RABBIT_PARKED_RETRY", "1"))
+RABBIT_PARKED_RETRY_MAX = float(os.getenv("RABBIT_PARKED_RETRY_MAX", "60"))
+RABBIT_PARKED_MAX = int(os.getenv("RABBIT_PARKED_MAX", "10000"))
+
+# Консюмер алертов: RABBIT_CONSUMER_BULK=1 - параллельная обработка
+# RABBIT_CONSUMER_CONCURRENCY сообщений и подтверждение пачками
+# ack(multiple=True) по RABBIT_ACK_BATCH или раз в RABBIT_ACK_INTERVAL секунд,
+# prefetch подстраивается от RABBIT_PREFETCH до RABBIT_PREFETCH_MAX
+RABBIT_CONSUMER_BULK = os.getenv("RABBIT_CONSUMER_BULK", "0") == "1"
+RABBIT_CONSUMER_CONCURRENCY = int(os.getenv("RABBIT_CONSUMER_CONCURRENCY", "8"))
+RABBIT_PREFETCH = int(os.getenv("RABBIT_PREFETCH", "10"))
+RABBIT_PREFETCH_MAX = int(os.getenv("RABBIT_PREFETCH_MAX", "1000"))
+RABBIT_ACK_BATCH = int(os.getenv("RABBIT_ACK_BATCH", "32"))
+RABBIT_ACK_INTERVAL = float(os.getenv("RABBIT_ACK_INTERVAL", "0.05"))
+
+# Fanout-обменник алертов. RABBIT_CONSUMER_BROADCAST=1 - каждый SSE-сервер
+# читает свою временную очередь и получает все алерты, 0 - серверы делят
+# общую durable-очередь trading_alerts. Она привязана в обоих режимах, ее рост
+# ограничен RABBIT_ALERTS_QUEUE_MAX_LENGTH сообщениями (старые вытесняются)
+# и сроком жизни RABBIT_ALERTS_QUEUE_TTL секунд, 0 - без ограничения.
+# Аргументы очереди задаются при ее создании: после их смены существующую
+# очередь нужно удалить или задать лимиты политикой брокера
+RABBIT_EXCHANGE = os.getenv("RABBIT_EXCHANGE", "trading_alerts.fanout")
+RABBIT_CONSUMER_BROADCAST = os.getenv("RABBIT_CONSUMER_BROADCAST", "1") == "1"
+RABBIT_ALERTS_QUEUE_MAX_LENGTH = int(os.getenv("RABBIT_ALERTS_QUEUE_MAX_LENGTH", "10000"))
+RABBIT_ALERTS_QUEUE_TTL = float(os.getenv("RABBIT_ALERTS_QUEUE_TTL", "86400"))
+
+# Очередь каждого SSE-клиента: размер и политика переполнения -
+# drop_oldest, coalesce (новый алерт тикера заменяет ожидающий) или
+# disconnect (отставший клиент отключается)
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "256"))
+SSE_QUEUE_POLICY = os.getenv("SSE_QUEUE_POLICY", "drop_oldest")
+
+# Сколько последних событий SSE хранить, чтобы дослать их переподключившимся
+# клиентам по Last-Event-ID
+SSE_REPLAY_SIZE = int(os.getenv("SSE_REPLAY_SIZE", "1000"))
@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import math
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import grpc
+import numpy as np
+from google.protobuf.timestamp_pb2 import Timestamp
+
+from t_tech.invest.grpc import (
+    common_pb2,
+    instruments_pb2,
+    instruments_pb2_grpc,
+    marketdata_pb2,
+    marketdata_pb2_grpc,
+    operations_pb2,
+    operations_pb2_grpc,
+    users_pb2,
+    users_pb2_grpc,
+)
+
+from config import data_path
+
+
+ONE_MINUTE = timedelta(minutes=1)
+# get_candles отдает минутные свечи окнами не длиннее суток, как настоящий API
+MAX_CANDLES_RANGE = timedelta(days=1)
+ACCOUNT_ID = "fake-account"
+
+
+def _quotation(x: float, cls=common_pb2.Quotation, **fields):
+    units = math.floor(x)
+    return cls(units=units, nano=round((x - units) * 1e9), **fields)
+
+
+def _money(x: float, currency: str = "rub") -> common_pb2.MoneyValue:
+    return _quotation(x, common_pb2.MoneyValue, currency=currency)
+
+
+def _timestamp(x: datetime) -> Timestamp:
+    ts = Timestamp()
+    ts.FromDatetime(x)
+    return ts
+
+
+class FakeMarket:
+    """
+    Синтетический рынок: instruments акций с ценами - случайным блужданием.
+    Минута рынка длится minute_seconds реальных секунд (меньше 60 -
+    ускоренный рынок для нагрузки), в минуте торгуется доля trade_probability
+    инструментов. Свечи хранятся с начала истории history_days назад.
+    """
+
+    def __init__(self, instruments: int, history_days: float = 1.0, minute_seconds: float = 60.0,
+                 trade_probability: float = 0.8, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.n = instruments
+        self.minute_seconds = minute_seconds
+        self.trade_probability = trade_probability
+        self.uids = [f"fake-{i:05d}" for i in range(instruments)]
+        self.tickers = [f"FK{i:04d}" for i in range(instruments)]
+        self.index = {uid: i for i, uid in enumerate(self.uids)}
+
+        # Время рынка: реальное в момент запуска, дальше с ускорением
+        self.started = time.time()
+        now = datetime.fromtimestamp(self.started, timezone.utc).replace(second=0, microsecond=0)
+        self.origin = now - timedelta(days=history_days)
+
+        self.close = self.rng.uniform(10.0, 3000.0, instruments).round(2)
+        # Минута k: цены (open, high, low, close), объем; объем 0 - сделок не было
+        self.prices: list[np.ndarray] = []
+        self.volumes: list[np.ndarray] = []
+        for _ in range(int((now - self.origin) / ONE_MINUTE)):
+            self._step()
+
+    def now(self) -> datetime:
+        elapsed = (time.time() - self.started) * 60.0 / self.minute_seconds
+        return datetime.fromtimestamp(self.started + elapsed, timezone.utc)
+
+    @property
+    def closed(self) -> int:
+        """Сколько минут рынка уже закрыто."""
+        return len(self.prices)
+
+    def minute_time(self, k: int) -> datetime:
+        return self.origin + k * ONE_MINUTE
+
+    def _step(self):
+        traded = self.rng.random(self.n) < self.trade_probability
+        close = np.where(traded, (self.close * np.exp(self.rng.normal(0.0, 0.002, self.n))).round(2), self.close)
+        spread = np.abs(self.rng.normal(0.0, 0.001, self.n))
+        open_ = self.close
+        self.prices.append(np.stack([
+            open_,
+            (np.maximum(open_, close) * (1 + spread)).round(2),
+            (np.minimum(open_, close) * (1 - spread)).round(2),
+            close,
+        ]))
+        self.volumes.append(np.where(traded, self.rng.integers(1, 5000, self.n), 0))
+        self.close = close
+
+    def advance(self) -> list[int]:
+        """
+        Закрывает минуты, истекшие по часам рынка, и возвращает их номера.
+        Вызывает только MarketDataStreamService.run, раздающий минуты потокам.
+        """
+        target = int((self.now() - self.origin) / ONE_MINUTE)
+        closed = []
+        while self.closed < target:
+            self._step()
+            closed.append(self.closed - 1)
+        return closed
+
+    def candle(self, k: int, i: int, cls, **fields):
+        o, h, l, c = self.prices[k][:, i]
+        return cls(
+            open=_quotation(o), high=_quotation(h), low=_quotation(l), close=_quotation(c),
+            volume=int(self.volumes[k][i]), time=_timestamp(self.minute_time(k)), **fields
+        )
+
+    def traded(self, k: int, uids) -> list[int]:
+        volumes = self.volumes[k]
+        return [i for i in (self.index[uid] for uid in uids) if volumes[i]]
+
+
+async def _maybe_fail(context, error_rate: float):
+    if error_rate and random.random() < error_rate:
+        context.set_trailing_metadata((("x-ratelimit-reset", "1"),))
+        await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "fake: rate limit")
+
+
+class InstrumentsService(instruments_pb2_grpc.InstrumentsServiceServicer):
+    def __init__(self, market: FakeMarket, error_rate: float):
+        self.market = market
+        self.error_rate = error_rate
+
+    async def Shares(self, request, context):
+        await _maybe_fail(context, self.error_rate)
+        m = self.market
+        return instruments_pb2.SharesResponse(instruments=[
+            instruments_pb2.Share(
+                figi=f"FAKE{i:08d}", ticker=m.tickers[i], class_code="TQBR", isin=f"RU{i:010d}",
+                lot=1, currency="rub", name=f"Fake share {i}", exchange="MOEX", uid=uid,
+                api_trade_available_flag=True, buy_available_flag=True, sell_available_flag=True,
+            )
+            for i, uid in enumerate(m.uids)
+        ])
+
+    async def Bonds(self, request, context):
+        await _maybe_fail(context, self.error_rate)
+        placement = self.market.origin - timedelta(days=365)
+        return instruments_pb2.BondsResponse(instruments=[
+            instruments_pb2.Bond(
+                figi=f"FAKEB{i:07d}", ticker=f"FKB{i:04d}", class_code="TQCB", isin=f"RUB{i:09d}",
+                lot=1, currency="rub", name=f"Fake bond {i}", exchange="MOEX", uid=f"fake-bond-{i:05d}",
+                coupon_quantity_per_year=4, issue_size=1_000_000,
+                maturity_date=_timestamp(placement + timedelta(days=365 * (2 + i % 5))),
+                placement_date=_timestamp(placement),
+                call_date=_timestamp(datetime(1970, 1, 1, tzinfo=timezone.utc)),
+                nominal=_money(1000.0), initial_nominal=_money(1000.0), placement_price=_money(1000.0),
+                aci_value=_money(round(i % 30 * 0.87, 2)),
+                sector="corporate", country_of_risk="RU", country_of_risk_name="Российская Федерация",
+            )
+            for i in range(max(1, self.market.n // 10))
+        ])
+
+
+class MarketDataService(marketdata_pb2_grpc.MarketDataServiceServicer):
+    def __init__(self, market: FakeMarket, error_rate: float):
+        self.market = market
+        self.error_rate = error_rate
+
+    async def GetCandles(self, request, context):
+        await _maybe_fail(context, self.error_rate)
+        m = self.market
+        i = m.index.get(request.instrument_id or request.figi)
+        if i is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "instrument not found")
+
+        to = request.to.ToDatetime(tzinfo=timezone.utc) if request.HasField("to") else m.now()
+        if request.HasField("from"):
+            from_ = getattr(request, "from").ToDatetime(tzinfo=timezone.utc)
+            if to - from_ > MAX_CANDLES_RANGE:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "30014: max candles range exceeded")
+            first = max(0, math.ceil((from_ - m.origin) / ONE_MINUTE))
+        else:
+            first = 0
+        last = min(m.closed, math.ceil((to - m.origin) / ONE_MINUTE))
+
+        minutes = [k for k in range(first, last) if m.volumes[k][i]]
+        if request.HasField("limit"):
+            minutes = minutes[-request.limit:] if request.limit else []
+        return marketdata_pb2.GetCandlesResponse(candles=[
+            m.candle(k, i, marketdata_pb2.HistoricCandle, is_complete=True) for k in minutes
+        ])
+
+
+class MarketDataStreamService(marketdata_pb2_grpc.MarketDataStreamServiceServicer):
+    """
+    Поток свечей закрытых минут. Свечи минуты уходят всплеском в течение
+    spread_seconds, раз в lifetime секунд поток рвется с UNAVAILABLE,
+    чтобы клиент переподключался и догружал пропуск через get_candles.
+    """
+
+    def __init__(self, market: FakeMarket, spread_seconds: float, lifetime: float):
+        self.market = market
+        self.spread_seconds = spread_seconds
+        self.lifetime = lifetime
+        self.listeners: set[asyncio.Queue] = set()
+        self.sent = 0
+
+    async def run(self):
+        """Закрывает минуты рынка и раздает их номера открытым потокам."""
+        while True:
+            for k in self.market.advance():
+                for listener in self.listeners:
+                    listener.put_nowait(k)
+            next_close = self.market.minute_time(self.market.closed + 1)
+            delay = (next_close - self.market.now()).total_seconds() * self.market.minute_seconds / 60.0
+            await asyncio.sleep(max(0.01, delay))
+
+    async def _read_requests(self, request_iterator, subscribed: set[str]):
+        async for request in request_iterator:
+            if not request.HasField("subscribe_candles_request"):
+                continue
+            sub = request.subscribe_candles_request
+            uids = {x.instrument_id or x.figi for x in sub.instruments}
+            if sub.subscription_action == marketdata_pb2.SUBSCRIPTION_ACTION_UNSUBSCRIBE:
+                subscribed -= uids
+            else:
+                subscribed |= uids & self.market.index.keys()
+
+    def _subscribe_response(self, subscribed: set[str]) -> marketdata_pb2.MarketDataResponse:
+        return marketdata_pb2.MarketDataResponse(
+            subscribe_candles_response=marketdata_pb2.SubscribeCandlesResponse(
+                tracking_id=f"fake-{time.time_ns()}",
+                candles_subscriptions=[
+                    marketdata_pb2.CandleSubscription(
+                        figi=uid, instrument_uid=uid,
+                        interval=marketdata_pb2.SUBSCRIPTION_INTERVAL_ONE_MINUTE,
+                        subscription_status=marketdata_pb2.SUBSCRIPTION_STATUS_SUCCESS,
+                    )
+                    for uid in sorted(subscribed)
+                ],
+            )
+        )
+
+    async def MarketDataStream(self, request_iterator, context):
+        subscribed: set[str] = set()
+        reader = asyncio.create_task(self._read_requests(request_iterator, subscribed))
+        minutes = asyncio.Queue()
+        self.listeners.add(minutes)
+        opened = time.monotonic()
+        acked = 0
+        try:
+            while True:
+                if len(subscribed) != acked:
+                    acked = len(subscribed)
+                    yield self._subscribe_response(subscribed)
+                if self.lifetime and time.monotonic() - opened >= self.lifetime:
+                    await context.abort(grpc.StatusCode.UNAVAILABLE, "fake: stream reset")
+                try:
+                    k = await asyncio.wait_for(minutes.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    yield marketdata_pb2.MarketDataResponse(
+                        ping=marketdata_pb2.Ping(time=_timestamp(self.market.now()))
+                    )
+                    continue
+
+                traded = self.market.traded(k, subscribed)
+                parts = max(1, min(20, len(traded)))
+                for part in range(parts):
+                    for i in traded[part::parts]:
+                        yield marketdata_pb2.MarketDataResponse(candle=self.market.candle(
+                            k, i, marketdata_pb2.Candle,
+                            figi=self.market.uids[i], instrument_uid=self.market.uids[i],
+                            interval=marketdata_pb2.SUBSCRIPTION_INTERVAL_ONE_MINUTE,
+                            last_trade_ts=_timestamp(self.market.minute_time(k + 1) - timedelta(seconds=1)),
+                        ))
+                    self.sent += len(traded[part::parts])
+                    await asyncio.sleep(self.spread_seconds / parts)
+        finally:
+            self.listeners.discard(minutes)
+            reader.cancel()
+
+
+class UsersService(users_pb2_grpc.UsersServiceServicer):
+    async def GetAccounts(self, request, context):
+        return users_pb2.GetAccountsResponse(accounts=[
+            users_pb2.Account(
+                id=ACCOUNT_ID, name="Fake account",
+                type=users_pb2.ACCOUNT_TYPE_TINKOFF, status=users_pb2.ACCOUNT_STATUS_OPEN,
+                access_level=users_pb2.ACCOUNT_ACCESS_LEVEL_FULL_ACCESS,
+            )
+        ])
+
+
+class OperationsService(operations_pb2_grpc.OperationsServiceServicer):
+    """Портфель: по 10 лотов первых пяти акций фейкового рынка и рубли."""
+
+    CASH = 100_000.0
+
+    def __init__(self, market: FakeMarket):
+        self.market = market
+
+    def _holdings(self) -> list[tuple[int, int]]:
+        return [(i, 10) for i in range(min(5, self.market.n))]
+
+    async def GetPortfolio(self, request, context):
+        m = self.market
+        positions = []
+        shares = 0.0
+        for i, quantity in self._holdings():
+            price = float(m.close[i])
+            average = float(m.prices[0][0, i])
+            shares += price * quantity
+            positions.append(operations_pb2.PortfolioPosition(
+                figi=f"FAKE{i:08d}", instrument_type="share", instrument_uid=m.uids[i], ticker=m.tickers[i],
+                quantity=_quotation(quantity), average_position_price=_money(average),
+                current_price=_money(price), current_nkd=_money(0.0),
+                expected_yield=_quotation(round((price - average) * quantity, 2)),
+            ))
+        return operations_pb2.PortfolioResponse(
+            account_id=request.account_id,
+            total_amount_shares=_money(shares),
+            total_amount_bonds=_money(0.0),
+            total_amount_etf=_money(0.0),
+            total_amount_currencies=_money(self.CASH),
+            total_amount_futures=_money(0.0),
+            total_amount_portfolio=_money(shares + self.CASH),
+            expected_yield=_quotation(0.0),
+            positions=positions,
+        )
+
+    async def GetPositions(self, request, context):
+        m = self.market
+        return operations_pb2.PositionsResponse(
+            money=[_money(self.CASH)],
+            securities=[
+                operations_pb2.PositionsSecurities(
+                    figi=f"FAKE{i:08d}", instrument_uid=m.uids[i], ticker=m.tickers[i],
+                    instrument_type="share", balance=quantity,
+                )
+                for i, quantity in self._holdings()
+            ],
+        )
+
+
+def ensure_certificate(root: Path) -> tuple[bytes, bytes]:
+    """Самоподписанный сертификат localhost: SDK ходит в API только по TLS."""
+    root.mkdir(parents=True, exist_ok=True)
+    key, cert = root / "key.pem", root / "cert.pem"
+    if not cert.exists():
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "3650",
+             "-keyout", str(key), "-out", str(cert), "-subj", "/CN=localhost",
+             "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+            check=True, capture_output=True,
+        )
+    return key.read_bytes(), cert.read_bytes()
+
+
+async def serve(args):
+    market = FakeMarket(args.instruments, args.history_days, args.minute_seconds, args.trade_probability)
+    stream = MarketDataStreamService(market, args.spread_seconds, args.stream_lifetime)
+
+    server = grpc.aio.server()
+    instruments_pb2_grpc.add_InstrumentsServiceServicer_to_server(
+        InstrumentsService(market, args.error_rate), server
+    )
+    marketdata_pb2_grpc.add_MarketDataServiceServicer_to_server(
+        MarketDataService(market, args.error_rate), server
+    )
+    marketdata_pb2_grpc.add_MarketDataStreamServiceServicer_to_server(stream, server)
+    users_pb2_grpc.add_UsersServiceServicer_to_server(UsersService(), server)
+    operations_pb2_grpc.add_OperationsServiceServicer_to_server(OperationsService(market), server)
+
+    key, cert = ensure_certificate(args.cert_dir)
+    server.add_secure_port(f"{args.host}:{args.port}", grpc.ssl_server_credentials([(key, cert)]))
+    await server.start()
+
+    rate = args.instruments * args.trade_probability / args.minute_seconds
+    print(f"Fake T-Invest API on {args.host}:{args.port}: {args.instruments} shares, "
+          f"{market.closed} minutes of history, ~{rate:.0f} candles/s per full subscription\n"
+          f"Client env: INVEST_TARGET=localhost:{args.port} "
+          f"GRPC_DEFAULT_SSL_ROOTS_FILE_PATH={(args.cert_dir / 'cert.pem').resolve()}")
+    await asyncio.gather(server.wait_for_termination(), stream.run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный T-Invest API на синтетических данных")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--instruments", type=int, default=300)
+    parser.add_argument("--history-days", type=float, default=1.0)
+    parser.add_argument("--minute-seconds", type=float, default=60.0,
+                        help="реальная длительность минуты рынка, меньше 60 - ускоренный поток")
+    parser.add_argument("--trade-probability", type=float, default=0.8,
+                        help="доля инструментов со сделками в минуте")
+    parser.add_argument("--spread-seconds", type=float, default=1.0,
+                        help="за сколько секунд после закрытия минуты уходят ее свечи")
+    parser.add_argument("--stream-lifetime", type=float, default=0.0,
+                        help="рвать поток каждые N секунд, 0 - не рвать")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="доля unary-запросов с ответом RESOURCE_EXHAUSTED")
+    parser.add_argument("--cert-dir", type=Path, default=data_path / "fake_invest")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("Fake API stopped")
+
+
+if __name__ == "__main__":
+    main()
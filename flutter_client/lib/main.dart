@@ -40,6 +40,11 @@ class _AlertsScreenState extends State<AlertsScreen> {
   // Состояние подключения
   bool _isConnected = false;
 
+  // id последнего полученного события: после обрыва сервер дошлет то, что после него
+  String? _lastEventId;
+  String? _pendingEventId;
+  Timer? _reconnectTimer;
+
   @override
   void initState() {
     super.initState();
@@ -52,6 +57,9 @@ class _AlertsScreenState extends State<AlertsScreen> {
     final url = Uri.parse('http://192.168.1.221:8000/stream');
     final client = http.Client();
     final request = http.Request('GET', url);
+    if (_lastEventId != null) {
+      request.headers['Last-Event-ID'] = _lastEventId!;
+    }
 
     try {
       final response = await client.send(request);
@@ -62,24 +70,40 @@ class _AlertsScreenState extends State<AlertsScreen> {
           .transform(utf8.decoder)
           .transform(const LineSplitter())
           .listen((line) {
-        if (line.startsWith('data: ')) {
+        if (line.startsWith('id: ')) {
+          _pendingEventId = line.substring(4);
+        } else if (line.startsWith('data: ')) {
           final dataString = line.substring(6);
           if (dataString.isNotEmpty) {
             final Map<String, dynamic> alert = jsonDecode(dataString);
             _handleIncomingAlert(alert);
           }
+        } else if (line.isEmpty && _pendingEventId != null) {
+          // Пустая строка завершает событие: теперь оно точно получено целиком
+          _lastEventId = _pendingEventId;
+          _pendingEventId = null;
         }
       }, onDone: () {
         setState(() => _isConnected = false);
+        _scheduleReconnect();
       }, onError: (error) {
         setState(() => _isConnected = false);
+        _scheduleReconnect();
       });
     } catch (e) {
       setState(() => _isConnected = false);
       print('Ошибка подключения: $e');
+      _scheduleReconnect();
     }
   }
 
+  void _scheduleReconnect() {
+    // Переподключаемся через 3 секунды с Last-Event-ID последнего события
+    _pendingEventId = null;
+    _reconnectTimer?.cancel();
+    _reconnectTimer = Timer(const Duration(seconds: 3), _connectToSSE);
+  }
+
   void _handleIncomingAlert(Map<String, dynamic> alert) {
     // 1. Добавляем алерт в текущий невидимый буфер
     _currentBatch.add(alert);
@@ -103,6 +127,7 @@ class _AlertsScreenState extends State<AlertsScreen> {
   @override
   void dispose() {
     _debounceTimer?.cancel();
+    _reconnectTimer?.cancel();
     super.dispose();
   }
 
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from t_tech.invest import AsyncClient, CandleInterval
+from t_tech.invest.utils import now
+
+from config import INVEST_TOKEN, INVEST_TARGET, HISTORY_DIR, HISTORY_BUCKETS
+from candle_store import SCHEMA
+from candle_decoder import decode_candles
+from history_store import HistoryStore
+from request_scheduler import RequestScheduler
+
+
+# Максимальное окно одного запроса минутных свечей в get_candles
+CHUNK = timedelta(days=1)
+ONE_MINUTE = timedelta(minutes=1)
+
+
+async def get_rub_shares(client, scheduler: RequestScheduler) -> dict:
+    shares = await scheduler.call("shares", client.instruments.shares)
+    rub_shares = {
+        x.uid: {
+            'ticker': x.ticker,
+            'name': x.name,
+        }
+        for x in shares.instruments if x.currency == "rub"
+    }
+    return rub_shares
+
+
+def split_range(from_: datetime, to: datetime, chunk: timedelta = CHUNK) -> list[tuple[datetime, datetime]]:
+    """Режет [from_, to) на окна не длиннее chunk."""
+    chunks = []
+    while from_ < to:
+        chunks.append((from_, min(from_ + chunk, to)))
+        from_ += chunk
+    return chunks
+
+
+async def fetch_candles_for_share(client, scheduler: RequestScheduler,
+                                  to: datetime, from_: datetime,
+                                  ticker: str, uid: str, name: str) -> pl.DataFrame:
+    raw_candles = await scheduler.call(
+        "get_candles",
+        client.market_data.get_candles,
+        instrument_id=uid,
+        to=to,
+        from_=from_,
+        interval=CandleInterval.CANDLE_INTERVAL_1_MIN
+    )
+    return decode_candles(raw_candles.candles, ticker, uid, name)
+
+
+def stitch(frames: list[pl.DataFrame]) -> pl.DataFrame:
+    """Склеивает окна в один кадр: без повторов на стыках, по времени."""
+    if not frames:
+        return pl.DataFrame(schema=SCHEMA)
+    return (
+        pl.concat(frames)
+        .unique(subset=["uid", "timestamp_utc"], keep="last")
+        .sort(["timestamp_utc", "ticker"])
+    )
+
+
+async def load_candles(client, scheduler: RequestScheduler, shares: dict,
+                       ranges: dict[str, tuple[datetime, datetime]]) -> pl.DataFrame:
+    """
+    Загружает минутные свечи за произвольные интервалы ranges[uid] = (from_, to).
+    Интервал каждого инструмента режется на окна по CHUNK, все окна всех
+    инструментов запрашиваются параллельно, темп держит RequestScheduler.
+    """
+    chunks = [
+        (uid, chunk_from, chunk_to)
+        for uid, (from_, to) in ranges.items()
+        for chunk_from, chunk_to in split_range(from_, to)
+    ]
+    results = await asyncio.gather(
+        *(
+            fetch_candles_for_share(
+                client=client,
+                scheduler=scheduler,
+                to=chunk_to,
+                from_=chunk_from,
+                ticker=shares[uid]["ticker"],
+                uid=uid,
+                name=shares[uid]["name"],
+            )
+            for uid, chunk_from, chunk_to in chunks
+        ),
+        return_exceptions=True,
+    )
+
+    frames = []
+    failed = []
+    for (uid, chunk_from, chunk_to), r in zip(chunks, results):
+        if isinstance(r, Exception):
+            failed.append(f"{shares[uid]['ticker']} {chunk_from:%Y-%m-%d %H:%M}-{chunk_to:%H:%M}: {r!r}")
+        elif not r.is_empty():
+            frames.append(r)
+
+    if failed:
+        print(f"Error fetching {len(failed)} of {len(chunks)} candle chunks:\n" + "\n".join(failed))
+
+    return stitch(frames)
+
+
+async def main():
+    """Заполняет локальную историю за последние --days дней до уже сохраненной."""
+    parser = argparse.ArgumentParser(description="Загрузка истории минутных свечей")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--batch-days", type=int, default=7,
+                        help="сколько дней держать в памяти до записи на диск")
+    args = parser.parse_args()
+
+    scheduler = RequestScheduler()
+    history = HistoryStore(HISTORY_DIR, HISTORY_BUCKETS)
+
+    to = now()
+    lf = history.scan()
+    if lf is not None:
+        saved_from = lf.select(pl.col("timestamp_utc").min()).collect().item()
+        if saved_from is not None:
+            to = min(to, saved_from)
+    from_ = now() - timedelta(days=args.days)
+
+    async with AsyncClient(INVEST_TOKEN, target=INVEST_TARGET) as client:
+        shares = await get_rub_shares(client, scheduler)
+        started = time.monotonic()
+        total = 0
+        for batch_from, batch_to in split_range(from_, to, timedelta(days=args.batch_days)):
+            df = await load_candles(
+                client, scheduler, shares, {uid: (batch_from, batch_to) for uid in shares}
+            )
+            history.append(df)
+            await history.flush()
+            total += df.shape[0]
+            print(f"{batch_from:%Y-%m-%d} - {batch_to:%Y-%m-%d}: {df.shape[0]} candles")
+
+    print(f"Loaded {total} candles for {len(shares)} shares in {time.monotonic() - started:.0f}s")
+    print(scheduler.report())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import asyncio
+import shutil
+import time
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+
+import polars as pl
+
+from alert_rules import TARGET_TZ, msk_date
+from candle_store import SCHEMA
+
+
+class HistoryStore:
+    """
+    Локальная история минутных свечей в Parquet.
+
+    Файлы разложены по партициям root/date=YYYY-MM-DD/bucket=NN/part-*.parquet,
+    где date - торговый день (МСК), bucket - номер группы инструментов.
+    Живой пайплайн копит свечи в памяти и сбрасывает их на диск раз в
+    flush_seconds, при старте история читается лениво с отсечением партиций.
+    """
+
+    def __init__(self, root: Path, buckets: int = 16, flush_seconds: float = 60.0):
+        self.root = Path(root)
+        self.buckets = buckets
+        self.flush_seconds = flush_seconds
+        self.pending: list[pl.DataFrame] = []
+        self.last_flush = time.monotonic()
+
+    def bucket(self, uid: str) -> int:
+        return zlib.crc32(uid.encode()) % self.buckets
+
+    def append(self, df: pl.DataFrame):
+        if not df.is_empty():
+            self.pending.append(df.select(SCHEMA.keys()))
+
+    @property
+    def due(self) -> bool:
+        return time.monotonic() - self.last_flush >= self.flush_seconds
+
+    def _partition_path(self, day: date, bucket: int) -> Path:
+        return self.root / f"date={day.isoformat()}" / f"bucket={bucket:02d}"
+
+    def _write(self, df: pl.DataFrame):
+        buckets = {uid: self.bucket(uid) for uid in df["uid"].unique()}
+        df = df.with_columns(
+            date=msk_date(pl.col("timestamp_utc")),
+            bucket=pl.col("uid").replace_strict(buckets, return_dtype=pl.UInt16),
+        )
+        for (day, bucket), part in df.partition_by(["date", "bucket"], as_dict=True).items():
+            path = self._partition_path(day, bucket)
+            path.mkdir(parents=True, exist_ok=True)
+            part.drop(["date", "bucket"]).sort(["uid", "timestamp_utc"]).write_parquet(
+                path / f"part-{time.time_ns()}.parquet"
+            )
+
+    async def flush(self):
+        """Сбрасывает накопленные свечи на диск в отдельном потоке."""
+        frames = self.pending
+        self.pending = []
+        self.last_flush = time.monotonic()
+        if frames:
+            await asyncio.to_thread(self._write, pl.concat(frames))
+
+    def _files(self) -> list[Path]:
+        return list(self.root.glob("date=*/bucket=*/*.parquet")) if self.root.exists() else []
+
+    def scan(self) -> pl.LazyFrame | None:
+        if not self._files():
+            return None
+        return pl.scan_parquet(
+            self.root / "date=*" / "bucket=*" / "*.parquet",
+            hive_partitioning=True,
+            hive_schema={"date": pl.Date, "bucket": pl.UInt16},
+        )
+
+    def load(self, since: datetime) -> pl.DataFrame:
+        """Читает свечи не старше since. Лишние дни отсекаются по партициям."""
+        lf = self.scan()
+        if lf is None:
+            return pl.DataFrame(schema=SCHEMA)
+        since_day = since.astimezone(TARGET_TZ).date()
+        return (
+            lf.filter(pl.col("date") >= since_day)
+            .filter(pl.col("timestamp_utc") >= since)
+            .select(SCHEMA.keys())
+            .unique(subset=["uid", "timestamp_utc"], keep="last")
+            .sort(["timestamp_utc", "ticker"])
+            .collect()
+        )
+
+    @staticmethod
+    def last_timestamps(df: pl.DataFrame) -> dict[str, datetime]:
+        last = df.group_by("uid").agg(pl.col("timestamp_utc").max())
+        return dict(zip(last["uid"], last["timestamp_utc"]))
+
+    def recover(self):
+        """
+        Доводит до конца прерванные compact: .bucket=NN - новый файл партиции,
+        .bucket=NN.old - отодвинутая старая партиция.
+        """
+        for old in self.root.glob("date=*/.bucket=*.old"):
+            path = old.with_name(old.name[1:].removesuffix(".old"))
+            tmp = old.with_name("." + path.name)
+            if not path.exists():
+                (tmp if tmp.exists() else old).rename(path)
+            if old.exists():
+                shutil.rmtree(old)
+        # Без .old падение случилось до подмены, новый файл мог не дописаться
+        for tmp in self.root.glob("date=*/.bucket=*"):
+            shutil.rmtree(tmp)
+
+    def compact(self, before: date):
+        """Склеивает файлы партиций дней раньше before в один файл на партицию."""
+        self.recover()
+        for path in self.root.glob("date=*/bucket=*"):
+            day = date.fromisoformat(path.parent.name.removeprefix("date="))
+            files = list(path.glob("*.parquet"))
+            if day >= before or len(files) < 2:
+                continue
+            df = (
+                pl.read_parquet(files, hive_partitioning=False)
+                .unique(subset=["uid", "timestamp_utc"], keep="last")
+                .sort(["uid", "timestamp_utc"])
+            )
+            # Старая партиция удаляется только после подмены: при падении
+            # между шагами recover() найдет обе копии
+            tmp = path.with_name("." + path.name)
+            old = path.with_name(tmp.name + ".old")
+            tmp.mkdir(exist_ok=True)
+            df.write_parquet(tmp / f"part-{time.time_ns()}.parquet")
+            path.rename(old)
+            tmp.rename(path)
+            shutil.rmtree(old)
@@ -0,0 +1,165 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import polars as pl
+
+
+EMA_SPANS = (10, 20, 50, 200)
+RSI_LENGTH = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+
+INDICATOR_COLUMNS = [
+    *(f"ema_{span}" for span in EMA_SPANS),
+    f"rsi_{RSI_LENGTH}",
+    "macd",
+    "macd_signal",
+    "macd_hist",
+]
+
+# EMA для MACD считаются вместе с остальными
+_SPANS = tuple(sorted(set(EMA_SPANS) | {MACD_FAST, MACD_SLOW}))
+
+
+def ema_step(prev: float | None, x: float, alpha: float) -> float:
+    return x if prev is None else alpha * x + (1 - alpha) * prev
+
+
+def span_alpha(span: int) -> float:
+    return 2 / (span + 1)
+
+
+@dataclass(slots=True)
+class IndicatorState:
+    """
+    Состояние индикаторов одного инструмента.
+    EMA и RSI - рекурсия с затравкой первым значением (ewm_mean(adjust=False)),
+    значение публикуется после накопления length свечей.
+    """
+    count: int = 0
+    last_timestamp: datetime | None = None
+    prev_close: float | None = None
+    ema: dict[int, float] = field(default_factory=dict)
+    avg_gain: float | None = None
+    avg_loss: float | None = None
+    macd_signal: float | None = None
+
+    def update(self, close: float):
+        for span in _SPANS:
+            self.ema[span] = ema_step(self.ema.get(span), close, span_alpha(span))
+
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        self.avg_gain = ema_step(self.avg_gain, max(delta, 0.0), 1 / RSI_LENGTH)
+        self.avg_loss = ema_step(self.avg_loss, max(-delta, 0.0), 1 / RSI_LENGTH)
+        self.prev_close = close
+        self.count += 1
+
+        if self.count >= MACD_SLOW:
+            macd = self.ema[MACD_FAST] - self.ema[MACD_SLOW]
+            self.macd_signal = ema_step(self.macd_signal, macd, span_alpha(MACD_SIGNAL))
+
+    def values(self) -> tuple:
+        count = self.count
+        emas = [self.ema[span] if count >= span else None for span in EMA_SPANS]
+
+        rsi = None
+        if count > RSI_LENGTH and self.avg_gain + self.avg_loss > 0:
+            rsi = 100 * self.avg_gain / (self.avg_gain + self.avg_loss)
+
+        macd = macd_signal = macd_hist = None
+        if count >= MACD_SLOW:
+            macd = self.ema[MACD_FAST] - self.ema[MACD_SLOW]
+        if count >= MACD_SLOW + MACD_SIGNAL - 1:
+            macd_signal = self.macd_signal
+            macd_hist = macd - macd_signal
+
+        return *emas, rsi, macd, macd_signal, macd_hist
+
+
+class StreamingIndicators:
+    """
+    EMA 10/20/50/200, RSI 14 и MACD 12/26/9 по каждому uid.
+    Каждая закрытая свеча обновляет состояние за O(1), история
+    загружается одним векторным проходом Polars.
+    """
+
+    def __init__(self):
+        self.states: dict[str, IndicatorState] = {}
+
+    def update(self, uid: str, close: float, timestamp_utc: datetime) -> bool:
+        state = self.states.get(uid)
+        if state is None:
+            state = self.states[uid] = IndicatorState()
+        elif timestamp_utc <= state.last_timestamp:
+            return False
+        state.update(close)
+        state.last_timestamp = timestamp_utc
+        return True
+
+    def update_frame(self, df: pl.DataFrame) -> int:
+        """Обновляет состояние по пачке в формате SCHEMA."""
+        updated = 0
+        rows = df.sort("timestamp_utc", maintain_order=True).select("uid", "close", "timestamp_utc")
+        for uid, close, timestamp_utc in rows.iter_rows():
+            updated += self.update(uid, close, timestamp_utc)
+        return updated
+
+    def seed(self, df: pl.DataFrame):
+        """Заполняет состояние по истории в формате SCHEMA одним запросом."""
+        if df.is_empty():
+            return
+
+        close = pl.col("close")
+        macd_ready = pl.int_range(pl.len()).over("uid") >= MACD_SLOW - 1
+
+        last = (
+            df.lazy()
+            .sort(["uid", "timestamp_utc"])
+            .with_columns(delta=close.diff().over("uid").fill_null(0.0))
+            .with_columns(
+                *(
+                    close.ewm_mean(span=span, adjust=False).over("uid").alias(f"_ema_{span}")
+                    for span in _SPANS
+                ),
+                avg_gain=pl.col("delta").clip(lower_bound=0.0)
+                .ewm_mean(alpha=1 / RSI_LENGTH, adjust=False).over("uid"),
+                avg_loss=(-pl.col("delta")).clip(lower_bound=0.0)
+                .ewm_mean(alpha=1 / RSI_LENGTH, adjust=False).over("uid"),
+            )
+            .with_columns(
+                macd_signal=pl.when(macd_ready)
+                .then(pl.col(f"_ema_{MACD_FAST}") - pl.col(f"_ema_{MACD_SLOW}"))
+                .ewm_mean(span=MACD_SIGNAL, adjust=False).over("uid")
+            )
+            .group_by("uid")
+            .agg(
+                pl.len().alias("count"),
+                pl.col("timestamp_utc").last(),
+                close.last(),
+                *(pl.col(f"_ema_{span}").last() for span in _SPANS),
+                pl.col("avg_gain").last(),
+                pl.col("avg_loss").last(),
+                pl.col("macd_signal").last(),
+            )
+            .collect()
+        )
+
+        for row in last.iter_rows(named=True):
+            self.states[row["uid"]] = IndicatorState(
+                count=row["count"],
+                last_timestamp=row["timestamp_utc"],
+                prev_close=row["close"],
+                ema={span: row[f"_ema_{span}"] for span in _SPANS},
+                avg_gain=row["avg_gain"],
+                avg_loss=row["avg_loss"],
+                macd_signal=row["macd_signal"],
+            )
+
+    def snapshot(self, uids) -> pl.DataFrame:
+        """Текущие значения индикаторов для перечисленных uid."""
+        uids = [uid for uid in uids if uid in self.states]
+        rows = [self.states[uid].values() for uid in uids]
+        return pl.DataFrame(
+            [uids, *zip(*rows)] if rows else [[] for _ in range(len(INDICATOR_COLUMNS) + 1)],
+            schema={"uid": pl.Utf8, **{column: pl.Float64 for column in INDICATOR_COLUMNS}},
+            orient="col",
+        )
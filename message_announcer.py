@@ -1,23 +1,216 @@
 import asyncio
+import bisect
+import itertools
 import json
+import time
+from dataclasses import dataclass
+
+from bounded_queue import BoundedQueue
+from config import SSE_QUEUE_SIZE, SSE_QUEUE_POLICY, SSE_REPLAY_SIZE
+
+
+# Что делать, когда клиент не успевает читать: выбросить самое старое
+# событие, заменить событие того же тикера новым или отключить клиента
+SSE_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    """Алерт, один раз закодированный в формат SSE, его id и трасса этапов."""
+    id: int
+    data: bytes
+    ticker: str | None = None
+    stages: dict | None = None
+
+
+def encode_event(event_id: int, message: dict) -> Event:
+    # Формат SSE: поле id для Last-Event-ID, префикс 'data:' и два переноса строки
+    data = f"id: {event_id}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n".encode()
+    return Event(event_id, data, message.get("ticker"), message.get("stages"))
+
+
+class ReplayRing:
+    """
+    Кольцевой буфер последних capacity событий с возрастающими id.
+    События после заданного id находятся двоичным поиском.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.events: list[Event | None] = [None] * capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _at(self, i: int) -> Event:
+        return self.events[(self.start + i) % self.capacity]
+
+    def append(self, event: Event):
+        if not self.capacity:
+            return
+        if self.size and event.id < self._at(self.size - 1).id:
+            self._insert(event)
+        elif self.size < self.capacity:
+            self.events[(self.start + self.size) % self.capacity] = event
+            self.size += 1
+        else:
+            self.events[self.start] = event
+            self.start = (self.start + 1) % self.capacity
+
+    def _insert(self, event: Event):
+        """Опоздавшее событие (повтор публикации) встает на место по id. Редкий путь за O(n)."""
+        events = [self._at(i) for i in range(self.size)]
+        bisect.insort(events, event, key=lambda x: x.id)
+        events = events[-self.capacity:]
+        self.events = events + [None] * (self.capacity - len(events))
+        self.start = 0
+        self.size = len(events)
+
+    def since(self, last_id: int) -> list[Event]:
+        """События с id больше last_id, по порядку."""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._at(mid).id <= last_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return [self._at(i) for i in range(lo, self.size)]
+
+
+def _ticker(event: Event | None) -> str | None:
+    return event.ticker if event is not None else None
+
+
+class Listener:
+    """Ограниченная очередь одного SSE-клиента и ее счетчики."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, maxsize: int = SSE_QUEUE_SIZE, policy: str = SSE_QUEUE_POLICY):
+        if policy not in SSE_POLICIES:
+            raise ValueError(f"SSE queue policy must be one of {SSE_POLICIES}")
+        self.id = next(self._ids)
+        self.policy = policy
+        # disconnect: очередь не вытесняет, переполнение отключает клиента
+        self.queue = BoundedQueue(
+            maxsize,
+            "block" if policy == "disconnect" else policy,
+            name=f"sse_{self.id}",
+            key=_ticker if policy == "coalesce" else None,
+        )
+        self.connected = time.time()
+        self.sent = 0
+        self.evicted = False
+
+    def offer(self, event: Event) -> bool:
+        """Кладет событие без ожидания. False - клиента пора отключить."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.policy == "disconnect":
+                return False
+            # coalesce: событие нового тикера в полной очереди вытесняет самое старое
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.dropped += 1
+            self.queue.put_nowait(event)
+        return True
+
+    def evict(self):
+        self.evicted = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        # Будит обработчик клиента, если он ждет в get()
+        self.queue.put_nowait(None)
+
+    async def get(self) -> Event | None:
+        """Следующее событие; None - клиент отключен за отставание."""
+        event = await self.queue.get()
+        self.queue.task_done()
+        return event
+
+    @property
+    def lag(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "id": self.id,
+            "policy": self.policy,
+            "connected": self.connected,
+            "sent": self.sent,
+            "lag": self.lag,
+            "max_lag": self.queue.high_water,
+            "dropped": self.queue.dropped,
+            "coalesced": self.queue.coalesced,
+        }
+
 
 class MessageAnnouncer:
-    def __init__(self):
-        # Список очередей для каждого подключенного SSE-клиента
-        self.listeners: list[asyncio.Queue] = []
+    def __init__(self, maxsize: int = SSE_QUEUE_SIZE, policy: str = SSE_QUEUE_POLICY,
+                 replay_size: int = SSE_REPLAY_SIZE):
+        if policy not in SSE_POLICIES:
+            raise ValueError(f"SSE queue policy must be one of {SSE_POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        # Очереди подключенных SSE-клиентов, удаление за O(1)
+        self.listeners: set[Listener] = set()
+        # Счетчики уже отключенных клиентов
+        self.dropped = 0
+        self.coalesced = 0
+        self.evicted = 0
+        # id события - id алерта, выданный паблишером: он один во всех
+        # экземплярах SSE-сервера, поэтому Last-Event-ID понятен любому из них
+        self.last_id = 0
+        self.ring = ReplayRing(replay_size)
+
+    def listen(self) -> Listener:
+        """Создает новую очередь для нового клиента и добавляет её в набор."""
+        listener = Listener(self.maxsize, self.policy)
+        self.listeners.add(listener)
+        return listener
 
-    def listen(self) -> asyncio.Queue:
-        """Создает новую очередь для нового клиента и добавляет её в список."""
-        q = asyncio.Queue()
-        self.listeners.append(q)
-        return q
+    def replay(self, last_id: int) -> list[Event]:
+        """
+        События после last_id из буфера. Вызывать сразу после listen(), без
+        await между ними: тогда пропусков и повторов между буфером и очередью нет.
+        """
+        return self.ring.since(last_id)
 
-    def remove(self, q: asyncio.Queue):
+    def remove(self, listener: Listener):
         """Удаляет очередь, когда клиент отключается."""
-        if q in self.listeners:
-            self.listeners.remove(q)
+        if listener in self.listeners:
+            self.listeners.discard(listener)
+            self.dropped += listener.queue.dropped
+            self.coalesced += listener.queue.coalesced
+
+    def totals(self) -> dict:
+        """Выброшенные и слитые события по всем клиентам, включая отключенных."""
+        return {
+            "dropped": self.dropped + sum(x.queue.dropped for x in self.listeners),
+            "coalesced": self.coalesced + sum(x.queue.coalesced for x in self.listeners),
+            "evicted": self.evicted,
+        }
 
     async def broadcast(self, message: dict):
-        """Отправляет сообщение во все активные очереди клиентов."""
-        for q in self.listeners:
-            await q.put(message)
\ No newline at end of file
+        """
+        Кодирует сообщение один раз и кладет общие байты во все очереди
+        клиентов без ожидания. Клиенты политики disconnect с полной
+        очередью отключаются.
+        """
+        event_id = message.get("id")
+        if event_id is None:
+            # Алерт без id от паблишера старой версии
+            event_id = self.last_id + 1
+        self.last_id = max(self.last_id, event_id)
+        event = encode_event(event_id, message)
+        self.ring.append(event)
+        slow = [listener for listener in self.listeners if not listener.offer(event)]
+        for listener in slow:
+            self.remove(listener)
+            listener.evict()
+            self.evicted += 1
+            print(f"🐢 SSE-клиент {listener.id} отключен: отстал на {self.maxsize} событий")
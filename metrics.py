@@ -0,0 +1,191 @@
+import asyncio
+import bisect
+import math
+
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+
+# Этапы пути свечи и алерта. Время каждого этапа - unix-время в секундах,
+# задержка этапа считается от закрытия свечи
+STAGES = ("received", "decoded", "batched", "analyzed", "published", "consumed", "sse")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(x: float) -> str:
+    if x == math.inf:
+        return "+Inf"
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+class Counter:
+    """
+    Счетчик с метками. Вместо inc() значения можно отдавать функцией
+    fn() -> {значения меток: число}, она вызывается при каждом чтении.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.fn = fn
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[x] for x in self.label_names)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        if self.fn is not None:
+            self.values = dict(self.fn())
+        for key, value in self.values.items():
+            yield self.name, _labels(self.label_names, key), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[tuple(labels[x] for x in self.label_names)] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[x] for x in self.label_names)
+        data = self.values.get(key)
+        if data is None:
+            data = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    def quantile(self, q: float, **labels) -> float:
+        """Оценка квантиля по корзинам, как histogram_quantile в Prometheus."""
+        data = self.values.get(tuple(labels[x] for x in self.label_names))
+        if data is None or not data[2]:
+            return math.nan
+        counts, _, count = data
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets, counts):
+            if n and cumulative + n >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = bound
+        return self.buckets[-1]
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                yield (
+                    f"{self.name}_bucket",
+                    _labels(self.label_names, key, f'le="{_number(bound)}"'),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", _labels(self.label_names, key), total
+            yield f"{self.name}_count", _labels(self.label_names, key), count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = (), fn=None) -> Counter:
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, labels: tuple = (), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "signals_stage_latency_seconds",
+    "Time from candle close until the stage was passed",
+    labels=("stage",),
+)
+# Начало последней минуты, по порядку прошедшей анализ: по ней видно,
+# насколько анализ отстает
+ANALYZED_MINUTE = REGISTRY.gauge(
+    "signals_analyzed_minute_seconds", "Start of the last minute analyzed in order, unix time"
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "signals_errors_total", "Errors by pipeline stage", labels=("stage",)
+)
+
+
+def observe_stages(trace: dict, stages=STAGES):
+    """Пишет задержки этапов трассы алерта или пачки, начиная с закрытия свечи."""
+    close = trace.get("close")
+    if close is None:
+        return
+    for stage in stages:
+        if stage in trace:
+            STAGE_LATENCY.observe(max(0.0, trace[stage] - close), stage=stage)
+
+
+def merge_traces(a: dict, b: dict) -> dict:
+    """Трасса слитой пачки: каждый этап - по самой поздней из частей."""
+    return {key: max(a.get(key, 0.0), b.get(key, 0.0)) for key in a.keys() | b.keys()}
+
+
+async def serve_metrics(port: int, registry: Registry = REGISTRY):
+    """Минимальный HTTP-сервер: на любой GET отдает registry.render()."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            body = registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, port=port)
+    print(f"Metrics on http://0.0.0.0:{port}/metrics")
+    async with server:
+        await server.serve_forever()
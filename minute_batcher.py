@@ -0,0 +1,140 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from metrics import merge_traces
+
+
+ONE_MINUTE = timedelta(minutes=1)
+
+
+@dataclass
+class BatchStats:
+    flushes: Counter = field(default_factory=Counter)
+    candles: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    latency_last: float = 0.0
+
+    def observe(self, reason: str, candles: int, latency: float | None = None):
+        self.flushes[reason] += 1
+        self.candles += candles
+        if latency is not None:
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latency_last = latency
+
+    def report(self) -> str:
+        total = sum(self.flushes.values())
+        timed = total - self.flushes["late"]
+        avg = self.latency_total / timed if timed else 0.0
+        reasons = ", ".join(f"{reason}={n}" for reason, n in sorted(self.flushes.items()))
+        return (
+            f"Batches: {total} ({reasons or '-'}), candles: {self.candles}, latency after minute "
+            f"close avg {avg:.2f}s, max {self.latency_max:.2f}s, last {self.latency_last:.2f}s"
+        )
+
+
+class MinuteBatcher:
+    """
+    Собирает свечи по минутам и отдает минуту на анализ, как только пришли
+    свечи всех ожидаемых инструментов или истек deadline секунд после
+    закрытия минуты. Ожидаются инструменты, торговавшиеся за последние
+    active_minutes минут: по остальным свечи может не быть вовсе.
+    Свечи уже отданной минуты или пришедшие после ее дедлайна (догрузка
+    после переподключения) уходят сразу.
+    """
+
+    def __init__(self, last_candle_time: dict[str, datetime], deadline: float = 3.0,
+                 active_minutes: int = 5):
+        self.deadline = timedelta(seconds=deadline)
+        self.active = timedelta(minutes=active_minutes)
+        self.last_seen = dict(last_candle_time)
+        self.frames: dict[datetime, list[pl.DataFrame]] = {}
+        # None - ожидаемых инструментов нет, минуту закрывает только дедлайн
+        self.missing: dict[datetime, set[str] | None] = {}
+        self.flushed_until: datetime | None = None
+        self.late: list[pl.DataFrame] = []
+        # Трассы этапов (unix-время прихода и декодирования) по минутам
+        self.traces: dict[datetime, dict] = {}
+        self.late_trace: dict = {}
+        self.stats = BatchStats()
+
+    def _expected(self, minute: datetime) -> set[str]:
+        since = minute - self.active
+        return {uid for uid, ts in self.last_seen.items() if ts >= since}
+
+    def add(self, df: pl.DataFrame, now: datetime, trace: dict | None = None):
+        trace = trace or {}
+        for (minute,), part in df.partition_by("timestamp_utc", as_dict=True).items():
+            uids = set(part["uid"])
+            flushed = self.flushed_until is not None and minute <= self.flushed_until
+            if flushed or now >= minute + ONE_MINUTE + self.deadline:
+                self.late.append(part)
+                self.late_trace = merge_traces(self.late_trace, trace)
+            else:
+                if minute not in self.frames:
+                    self.frames[minute] = []
+                    self.missing[minute] = self._expected(minute) or None
+                    self.traces[minute] = {}
+                self.frames[minute].append(part)
+                self.traces[minute] = merge_traces(self.traces[minute], trace)
+                if self.missing[minute] is not None:
+                    self.missing[minute] -= uids
+            for uid in uids:
+                if uid not in self.last_seen or self.last_seen[uid] < minute:
+                    self.last_seen[uid] = minute
+
+    def next_timeout(self, now: datetime) -> float | None:
+        """Сколько секунд ждать до ближайшего дедлайна, None - ждать нечего."""
+        if self.late:
+            return 0.0
+        if not self.frames:
+            return None
+        first = min(self.frames)
+        return max(0.0, (first + ONE_MINUTE + self.deadline - now).total_seconds())
+
+    def _reason(self, minute: datetime, now: datetime) -> str | None:
+        if now >= minute + ONE_MINUTE + self.deadline:
+            return "deadline"
+        if self.missing[minute] is not None and not self.missing[minute]:
+            return "complete"
+        return None
+
+    def flush(self, now: datetime) -> tuple[pl.DataFrame, dict] | None:
+        """
+        Забирает готовые минуты одной пачкой вместе с трассой этапов или
+        None, если готовых нет. В трассе close - закрытие последней минуты.
+        """
+        frames = []
+        trace = {}
+        if self.late:
+            frames += self.late
+            trace = self.late_trace
+            self.stats.observe("late", sum(x.height for x in self.late))
+            self.late = []
+            self.late_trace = {}
+
+        for minute in sorted(self.frames):
+            reason = self._reason(minute, now)
+            if reason is None:
+                # Следующие минуты ждут, чтобы пачки шли строго по времени
+                break
+            parts = self.frames.pop(minute)
+            del self.missing[minute]
+            frames += parts
+            trace = merge_traces(trace, self.traces.pop(minute))
+            self.flushed_until = minute
+            self.stats.observe(
+                reason,
+                sum(x.height for x in parts),
+                (now - minute - ONE_MINUTE).total_seconds(),
+            )
+
+        if not frames:
+            return None
+        df = pl.concat(frames) if len(frames) > 1 else frames[0]
+        close = df["timestamp_utc"].max() + ONE_MINUTE
+        return df, {**trace, "close": close.timestamp(), "batched": now.timestamp()}
@@ -1,12 +1,13 @@
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import asyncio
+import multiprocessing
+import queue
 
 import polars as pl
 
 from t_tech.invest import AsyncClient
 from t_tech.invest import (
-    CandleInterval,
     MarketDataRequest,
     SubscribeCandlesRequest,
     SubscriptionAction,
@@ -16,103 +17,70 @@ from t_tech.invest import (
 from t_tech.invest.exceptions import (
     AioRequestError,
 )
-from t_tech.invest.utils import now
 
-from config import INVEST_TOKEN
-from alert_engine import AlertEngine
+import clock
+from config import (
+    INVEST_TOKEN,
+    INVEST_TARGET,
+    CANDLE_WINDOW,
+    ALERT_ENGINE_INCREMENTAL,
+    ALERT_ENGINE_VERIFY,
+    ALERT_RULES_PATH,
+    ALERT_TIMEFRAMES,
+    HISTORY_DIR,
+    HISTORY_BUCKETS,
+    HISTORY_FLUSH_SECONDS,
+    STREAM_SHARDS,
+    STREAM_SHARD_PROCESSES,
+    STREAM_QUEUE_SIZE,
+    STREAM_QUEUE_POLICY,
+    STREAM_METADATA_QUEUE_SIZE,
+    STREAM_METADATA_POLICY,
+    STREAM_REPORT_SECONDS,
+    STREAM_DECODE_LINGER,
+    BATCH_DEADLINE_SECONDS,
+    BATCH_ACTIVE_MINUTES,
+    METRICS_PORT,
+    STREAM_RECORD_DIR,
+)
+from alert_engine import AlertEngine, LOOKBACK
+from candle_store import CandleStore, SCHEMA
+from indicators import StreamingIndicators
+from timeframes import TimeframeAggregator
+from history_store import HistoryStore
+from request_scheduler import RequestScheduler
+from history_loader import get_rub_shares, load_candles
+from candle_decoder import InstrumentTable, StreamDecoder
+from bounded_queue import BoundedQueue
+from minute_batcher import MinuteBatcher
+from stream_replay import RecordingClient, StreamRecorder
+from metrics import REGISTRY, ANALYZED_MINUTE, merge_traces, observe_stages, serve_metrics
+from stream_shards import ShardStats, split_shards, report_shards, register_metrics
 from rabbitmq import RabbitMQPublisher
 
 
 TARGET_TZ = ZoneInfo("Europe/Moscow")
 
-SCHEMA = {
-    "ticker": pl.Utf8,
-    "uid": pl.Utf8,
-    "name": pl.Utf8,
-    "open": pl.Float64,
-    "high": pl.Float64,
-    "low": pl.Float64,
-    "close": pl.Float64,
-    "volume": pl.Int64,
-    "timestamp_utc": pl.Datetime(time_unit="us", time_zone="UTC")
-}
-
-
-def quotation_to_float(x):
-    return x.units + (x.nano / 1e9)
-
-
-async def get_rub_shares(client) -> dict:
-    shares = await client.instruments.shares()
-    rub_shares = {
-        x.uid: {
-            'ticker': x.ticker,
-            'name': x.name,
-        }
-        for x in shares.instruments if x.currency == "rub"
-    }
-    return rub_shares
-
-
-async def fetch_candles_for_share(client, to: datetime, from_: datetime,
-                                  ticker: str, uid: str, name: str,
-                                  sem: asyncio.Semaphore) -> list[dict]:
-    async with sem:
-        try:
-            raw_candles = await client.market_data.get_candles(
-                instrument_id=uid,
-                to=to,
-                from_=from_,
-                interval=CandleInterval.CANDLE_INTERVAL_1_MIN
-            )
-            return [
-                {
-                   "ticker": ticker,
-                    "uid": uid,
-                    "name": name,
-                    "open": quotation_to_float(c.open),
-                    "high": quotation_to_float(c.high),
-                    "low": quotation_to_float(c.low),
-                    "close": quotation_to_float(c.close),
-                    "volume": c.volume,
-                    "timestamp_utc": c.time
-                }
-                for c in raw_candles.candles
-            ]
+CANDLES_ANALYZED = REGISTRY.counter("signals_candles_analyzed_total", "Candles passed to AlertEngine")
 
-        except Exception as e:
-            print(f"Error fetching candles for {ticker}: {e}")
-            return []
-
-
-async def minute_candles_to_dataframe(client, shares: dict) -> pl.DataFrame:
-    sem = asyncio.Semaphore(10)
-
-    tasks = [
-        fetch_candles_for_share(
-            client=client,
-            to=now(),
-            from_=now() - timedelta(days=1),
-            ticker=info["ticker"],
-            uid=uid,
-            name=info["name"],
-            sem=sem
-        )
-        for uid, info in shares.items()
-    ]
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+async def minute_candles_to_dataframe(client, scheduler: RequestScheduler, shares: dict,
+                                      since: dict[str, datetime] | None = None) -> pl.DataFrame:
+    since = since or {}
+    to = clock.now()
+    day_ago = to - timedelta(days=1)
 
-    all_rows = []
-    for r in results:
-        if isinstance(r, Exception):
+    ranges = {}
+    for uid in shares:
+        from_ = day_ago
+        if uid in since:
+            from_ = max(from_, since[uid] + timedelta(minutes=1))
+        # В интервале короче минуты не может быть закрытой свечи
+        if from_ + timedelta(minutes=1) > to:
             continue
-        all_rows.extend(r)
+        ranges[uid] = (from_, to)
 
-    df = pl.DataFrame(all_rows, schema=SCHEMA)
-    df = df.sort(["timestamp_utc", "ticker"])
-
-    return df
+    return await load_candles(client, scheduler, shares, ranges)
 
 
 async def request_iterator(instruments: list):
@@ -127,7 +95,31 @@ async def request_iterator(instruments: list):
         await asyncio.sleep(1)
 
 
-async def get_metadata(client, uid_list: list, out_queue: asyncio.Queue):
+async def backfill_gap(client, scheduler: RequestScheduler, shares: dict,
+                       last_candle_time: dict[str, datetime]) -> pl.DataFrame:
+    """
+    Догружает свечи, закрывшиеся пока поток был отключен: каждый инструмент
+    с его последней полученной минуты до текущего момента.
+    """
+    since = {uid: last_candle_time[uid] for uid in shares if uid in last_candle_time}
+    if not since:
+        return pl.DataFrame(schema=SCHEMA)
+    df = await minute_candles_to_dataframe(client, scheduler, {uid: shares[uid] for uid in since}, since)
+    print(f"Recovered {df.shape[0]} candles for {len(since)} instruments")
+    return df
+
+
+async def get_metadata(client, scheduler: RequestScheduler, shares: dict,
+                       last_candle_time: dict[str, datetime], out_queue: asyncio.Queue,
+                       stats: ShardStats):
+    """
+    Держит подписку на свечи. Пропуск после переподключения догружается
+    параллельно с уже открытым потоком: догрузка начинается с первым
+    сообщением потока, поэтому минута, закрывшаяся во время догрузки,
+    придет потоком. Сообщения потока ждут конца догрузки, чтобы свечи
+    попадали в очередь по времени.
+    """
+    uid_list = list(shares.keys())
     instruments = [
         CandleInstrument(
             instrument_id=uid,
@@ -136,103 +128,381 @@ async def get_metadata(client, uid_list: list, out_queue: asyncio.Queue):
         for uid in uid_list
     ]
     while True:
+        held = []
+        backfill = None
+
+        async def recover():
+            nonlocal held
+            df = await backfill_gap(client, scheduler, shares, last_candle_time)
+            if not df.is_empty():
+                await out_queue.put(df)
+            while held:
+                await out_queue.put(held.pop(0))
+            held = None
+
         try:
-            print("Connecting to market_data_stream")
+            print(f"Connecting to market_data_stream, shard {stats.shard}")
             async for metadata in client.market_data_stream.market_data_stream(
                 request_iterator(instruments)
             ):
-                await out_queue.put(metadata)
+                stats.connected = True
+                stats.on_message()
+                if backfill is None:
+                    backfill = asyncio.create_task(recover())
+                elif backfill.done():
+                    # Ошибка догрузки переподключает поток: пропуск догрузится заново
+                    backfill.result()
+                if held is not None:
+                    held.append(metadata)
+                else:
+                    await out_queue.put(metadata)
         except AioRequestError as e:
+            stats.errors += 1
             print(f"Stream canceled by server: {e.details}")
         except Exception as e:
+            stats.errors += 1
             print(f"Unexpected stream error: {repr(e)}")
+        finally:
+            if backfill is not None:
+                backfill.cancel()
 
-        print("Reconnecting after 3 seconds")
+        stats.connected = False
+        stats.reconnects += 1
+        print(f"Reconnecting shard {stats.shard} after 3 seconds")
         await asyncio.sleep(3)
 
 
-async def extract_candle(shares: dict, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+async def emit_batch(df: pl.DataFrame, trace: dict, last_candle_time: dict[str, datetime],
+                     out_queue: asyncio.Queue):
+    """Отдает пачку вместе с трассой этапов: когда свечи пришли и когда декодированы."""
+    last = df.group_by("uid").agg(pl.col("timestamp_utc").max())
+    last_candle_time.update(zip(last["uid"], last["timestamp_utc"]))
+    await out_queue.put((df, {**trace, "decoded": clock.time()}))
+
+
+async def extract_candle(instruments: InstrumentTable, last_candle_time: dict[str, datetime],
+                         in_queue: BoundedQueue, out_queue: asyncio.Queue, stats: ShardStats):
+    """
+    Декодирует свечи потока в колоночные пачки. Пачка уходит дальше, когда
+    поток молчит STREAM_DECODE_LINGER секунд, то есть сразу после очередного
+    всплеска свечей. Границы минут отслеживает MinuteBatcher в update_dataframe.
+    """
+    decoder = StreamDecoder(instruments)
     while True:
-        metadata = await in_queue.get()
+        try:
+            metadata = await asyncio.wait_for(
+                in_queue.get(), timeout=STREAM_DECODE_LINGER if decoder.size else None
+            )
+        except asyncio.TimeoutError:
+            stats.batches += 1
+            stats.queue = in_queue.stats()
+            trace = {"received": stats.last_message or clock.time()}
+            await emit_batch(decoder.take(), trace, last_candle_time, out_queue)
+            continue
+
+        # Свечи, догруженные после переподключения, идут той же очередью,
+        # чтобы попасть в хранилище строго после уже полученных из потока
+        if isinstance(metadata, pl.DataFrame):
+            if decoder.size:
+                trace = {"received": stats.last_message or clock.time()}
+                await emit_batch(decoder.take(), trace, last_candle_time, out_queue)
+            await emit_batch(metadata, {"received": clock.time()}, last_candle_time, out_queue)
+            continue
 
         if not metadata.candle:
             continue
 
         try:
-            candle = {
-                "ticker": metadata.candle.ticker,
-                "uid": metadata.candle.instrument_uid,
-                "name": shares[metadata.candle.instrument_uid]["name"],
-                "open": quotation_to_float(metadata.candle.open),
-                "high": quotation_to_float(metadata.candle.high),
-                "low": quotation_to_float(metadata.candle.low),
-                "close": quotation_to_float(metadata.candle.close),
-                "volume": metadata.candle.volume,
-                "timestamp_utc": metadata.candle.time,
-            }
-            await out_queue.put(candle)
+            stats.candles += decoder.add(metadata.candle)
         except AttributeError as e:
             print(f"AttributeError: {str(e)}")
             print({metadata})
 
 
-async def update_dataframe(in_queue: asyncio.Queue, df: pl.DataFrame, rabbit: RabbitMQPublisher):
-    engine = AlertEngine()
+def candle_uid(metadata) -> str | None:
+    """Ключ слияния сообщений потока: свечи одного инструмента заменяют друг друга."""
+    candle = getattr(metadata, "candle", None)
+    return candle.instrument_uid if candle else None
 
-    while True:
-        buffer = []
 
-        first_candle = await in_queue.get()
-        buffer.append(first_candle)
-        in_queue.task_done()
+def merge_batches(queued: tuple[pl.DataFrame, dict], new: tuple[pl.DataFrame, dict]) -> tuple[pl.DataFrame, dict]:
+    """
+    Сливает пачку со стоящей в очереди. Повторы одной минуты инструмента
+    схлопываются, разные минуты сохраняются: догруженные пачки несут
+    несколько минут, и ни одна не должна потеряться по пути в хранилище.
+    """
+    df = (
+        pl.concat([queued[0], new[0]])
+        .unique(subset=["uid", "timestamp_utc"], keep="last", maintain_order=True)
+        .sort("timestamp_utc", maintain_order=True)
+    )
+    return df, merge_traces(queued[1], new[1])
+
 
+async def run_shard(client, scheduler: RequestScheduler, shares: dict,
+                    last_candle_time: dict[str, datetime], out_queue: asyncio.Queue, stats: ShardStats):
+    """Свой поток market_data_stream и свой декодер для группы инструментов."""
+    queue_metadata = BoundedQueue(
+        STREAM_METADATA_QUEUE_SIZE, STREAM_METADATA_POLICY, name=f"metadata_{stats.shard}", key=candle_uid
+    )
+    await asyncio.gather(
+        get_metadata(client, scheduler, shares, last_candle_time, queue_metadata, stats),
+        extract_candle(InstrumentTable(shares), last_candle_time, queue_metadata, out_queue, stats),
+    )
+
+
+async def shard_worker_main(shares: dict, last_candle_time: dict[str, datetime],
+                            channel: multiprocessing.Queue, stats: ShardStats):
+    # Догрузка пропусков идет из каждого процесса, лимит API делится между ними
+    scheduler = RequestScheduler(headroom=0.9 / STREAM_SHARDS)
+    batches = asyncio.Queue()
+
+    async def forward():
         while True:
             try:
-                next_candle = await asyncio.wait_for(in_queue.get(), timeout=2.0)
-                buffer.append(next_candle)
-                in_queue.task_done()
+                batch = await asyncio.wait_for(batches.get(), timeout=10.0)
             except asyncio.TimeoutError:
-                break
+                batch = None
+            await asyncio.to_thread(channel.put, (batch, stats.snapshot()))
+
+    async with AsyncClient(INVEST_TOKEN, target=INVEST_TARGET) as client:
+        if STREAM_RECORD_DIR:
+            client = RecordingClient(client, StreamRecorder(STREAM_RECORD_DIR, prefix=f"shard{stats.shard}"))
+        await asyncio.gather(
+            run_shard(client, scheduler, shares, last_candle_time, batches, stats),
+            forward(),
+        )
+
+
+def shard_worker(shares: dict, last_candle_time: dict[str, datetime],
+                 channel: multiprocessing.Queue, shard: int):
+    stats = ShardStats(shard, len(shares))
+    try:
+        asyncio.run(shard_worker_main(shares, last_candle_time, channel, stats))
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_shard_process(shares: dict, last_candle_time: dict[str, datetime],
+                            out_queue: asyncio.Queue, stats: ShardStats):
+    """
+    Шард в отдельном процессе: процесс сам держит поток и декодирует свечи,
+    сюда приходят готовые пачки и снимки статистики. Упавший процесс
+    перезапускается и догружает пропуск с последней полученной свечи.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    while True:
+        channel = ctx.Queue(maxsize=STREAM_QUEUE_SIZE)
+        shard_last = {uid: last_candle_time[uid] for uid in shares if uid in last_candle_time}
+        process = ctx.Process(
+            target=shard_worker, args=(shares, shard_last, channel, stats.shard), daemon=True
+        )
+        process.start()
+        try:
+            while process.is_alive():
+                try:
+                    batch, snapshot = await asyncio.to_thread(channel.get, timeout=1.0)
+                except queue.Empty:
+                    continue
+                stats.restore(snapshot)
+                if batch is not None:
+                    df, trace = batch
+                    last = df.group_by("uid").agg(pl.col("timestamp_utc").max())
+                    last_candle_time.update(zip(last["uid"], last["timestamp_utc"]))
+                    await out_queue.put((df, trace))
+        finally:
+            process.terminate()
+            process.join()
+        stats.connected = False
+        stats.restarts += 1
+        print(f"Shard {stats.shard} process exited with code {process.exitcode}, restarting")
+        await asyncio.sleep(3)
+
+
+def build_engines(store: CandleStore,
+                  aggregator: TimeframeAggregator) -> tuple[dict[int, AlertEngine], dict[int, CandleStore]]:
+    """
+    Движки правил по таймфреймам и хранилища их баров. Минутные бары - общее
+    хранилище store, для старших таймфреймов хранятся последние LOOKBACK баров.
+    """
+    history = store.to_frame()
+    bars = {1: history, **aggregator.seed(history)}
+    engines = {}
+    stores = {1: store}
+    for timeframe, df in bars.items():
+        if timeframe != 1:
+            stores[timeframe] = CandleStore(window=LOOKBACK, capacity=max(1, len(store.uids)))
+            stores[timeframe].extend(df)
+        indicators = StreamingIndicators()
+        indicators.seed(df)
+        engine = AlertEngine(
+            rules_path=ALERT_RULES_PATH,
+            indicators=indicators,
+            timeframe=timeframe,
+            verify=ALERT_ENGINE_VERIFY and timeframe == 1,
+        )
+        engine.seed(df, check=timeframe == 1)
+        engines[timeframe] = engine
+    return engines, stores
+
+
+def trace_alerts(alerts: list[dict], trace: dict, timeframe: int) -> list[dict]:
+    """Прикладывает к алертам трассу пачки; close - закрытие бара алерта."""
+    analyzed = clock.time()
+    for alert in alerts:
+        close = datetime.fromisoformat(alert["timestamp_utc"]) + timedelta(minutes=timeframe)
+        alert["stages"] = trace | {"close": close.timestamp(), "analyzed": analyzed}
+    return alerts
+
+
+def analyze_candles(batch: pl.DataFrame, stores: dict[int, CandleStore], engines: dict[int, AlertEngine],
+                    aggregator: TimeframeAggregator,
+                    incremental: bool = ALERT_ENGINE_INCREMENTAL) -> dict[int, list[dict]]:
+    """
+    Шаг минутного тика: собирает бары старших таймфреймов, кладет пачку
+    и бары в хранилища и прогоняет правила. Возвращает алерты по таймфреймам.
+    """
+    store = stores[1]
+    bars = {1: batch, **aggregator.update_frame(batch)}
+
+    alerts = {}
+    for timeframe, df in bars.items():
+        if df.is_empty():
+            continue
+        stores[timeframe].extend(df)
+        engine = engines[timeframe]
+        engine.indicators.update_frame(df)
+        engine.reload_rules()
+
+        if timeframe == 1 and not incremental:
+            alerts[timeframe] = engine.analyze(store.to_frame(last_n=LOOKBACK))
+        else:
+            full_df = None
+            if timeframe == 1 and ALERT_ENGINE_VERIFY:
+                full_df = store.to_frame(last_n=LOOKBACK)
+            alerts[timeframe] = engine.analyze_batch(df, stores[timeframe], full_df)
+    return alerts
+
+
+async def update_dataframe(in_queue: asyncio.Queue, store: CandleStore, history: HistoryStore,
+                           rabbit: RabbitMQPublisher, batcher: MinuteBatcher):
+    aggregator = TimeframeAggregator(ALERT_TIMEFRAMES)
+    engines, stores = build_engines(store, aggregator)
+
+    while True:
+        try:
+            df, trace = await asyncio.wait_for(
+                in_queue.get(), timeout=clock.timeout(batcher.next_timeout(clock.now()))
+            )
+            in_queue.task_done()
+            batcher.add(df, clock.now(), trace)
+            clock.received(df)
+        except asyncio.TimeoutError:
+            pass
+
+        flushed = batcher.flush(clock.now())
+        if flushed is None:
+            continue
+        batch, trace = flushed
 
-        if buffer:
-            new_df = pl.DataFrame(buffer, schema=SCHEMA)
-            df = pl.concat([df, new_df])
+        alerts = analyze_candles(batch, stores, engines, aggregator)
+        history.append(batch)
 
-            # print(f"Minute done\n"
-            #       f"Candles added: {len(buffer)}\n"
-            #       f"DataFrame length: {df.shape[0]}\n")
+        # print(f"Minute done\n"
+        #       f"Candles added: {batch.shape[0]}\n"
+        #       f"Store length: {len(store)}\n")
 
-            message_list = engine.analyze(df)
+        message_list = []
+        for timeframe, timeframe_alerts in alerts.items():
+            message_list += trace_alerts(timeframe_alerts, trace, timeframe)
 
-            if message_list:
-                await rabbit.publish_batch(message_list)
+        trace["analyzed"] = clock.time()
+        observe_stages(trace, ("received", "decoded", "batched", "analyzed"))
+        CANDLES_ANALYZED.inc(batch.height)
+        if batcher.flushed_until is not None:
+            ANALYZED_MINUTE.set(batcher.flushed_until.timestamp())
+        clock.analyzed(batch["timestamp_utc"].max())
 
-            del buffer
-            del new_df
+        if message_list:
+            await rabbit.publish_batch(message_list)
+
+        if history.due:
+            await history.flush()
+
+
+async def run(client, scheduler: RequestScheduler, rabbit: RabbitMQPublisher, history: HistoryStore,
+              shard_processes: bool = STREAM_SHARD_PROCESSES, metrics_port: int = METRICS_PORT):
+    """Весь пайплайн поверх готового клиента API: живого или воспроизводящего запись."""
+    shares = await get_rub_shares(client, scheduler)
+
+    await asyncio.to_thread(history.compact, clock.now().astimezone(TARGET_TZ).date())
+    saved_df = history.load(since=clock.now() - timedelta(days=1))
+    print(f"Loaded {saved_df.shape[0]} candles from local history")
+
+    # Догружаем каждый инструмент с его последней сохраненной минуты:
+    # у инструмента, не попавшего в сброс, своя дыра
+    since = history.last_timestamps(saved_df)
+
+    df = await minute_candles_to_dataframe(client, scheduler, shares, since)
+    print(scheduler.report())
+    history.append(df)
+    await history.flush()
+
+    store = CandleStore(window=CANDLE_WINDOW, capacity=len(shares))
+    store.extend(pl.concat([saved_df, df]))
+    del df, saved_df
+    last_candle_time = {uid: store.last_timestamp(uid) for uid in store.uids}
+
+    shards = split_shards(shares, STREAM_SHARDS)
+    stats = [ShardStats(i, len(x)) for i, x in enumerate(shards)]
+    batcher = MinuteBatcher(last_candle_time, BATCH_DEADLINE_SECONDS, BATCH_ACTIVE_MINUTES)
+    queue_candle = BoundedQueue(
+        STREAM_QUEUE_SIZE, STREAM_QUEUE_POLICY, name="candles", merge=merge_batches
+    )
+    if shard_processes:
+        producers = [
+            run_shard_process(x, last_candle_time, queue_candle, s)
+            for x, s in zip(shards, stats)
+        ]
+    else:
+        producers = [
+            run_shard(client, scheduler, x, last_candle_time, queue_candle, s)
+            for x, s in zip(shards, stats)
+        ]
+
+    register_metrics(stats, [queue_candle], batcher.stats)
+    services = [serve_metrics(metrics_port)] if metrics_port else []
+
+    try:
+        await asyncio.gather(
+            *producers,
+            *services,
+            update_dataframe(queue_candle, store, history, rabbit, batcher),
+            report_shards(stats, STREAM_REPORT_SECONDS, [queue_candle], batcher.stats),
+        )
+    except asyncio.CancelledError:
+        print("Get interrupt")
+        raise
+    finally:
+        await history.flush()
 
 
 async def main():
     rabbit = RabbitMQPublisher()
     await rabbit.connect()
 
-    async with AsyncClient(INVEST_TOKEN) as client:
-        shares = await get_rub_shares(client)
-        uid_list = list(shares.keys())
-
-        df = await minute_candles_to_dataframe(client, shares)
-
-        queue_metadata = asyncio.Queue()
-        queue_candle = asyncio.Queue()
+    scheduler = RequestScheduler()
+    history = HistoryStore(HISTORY_DIR, HISTORY_BUCKETS, HISTORY_FLUSH_SECONDS)
 
+    async with AsyncClient(INVEST_TOKEN, target=INVEST_TARGET) as client:
+        if STREAM_RECORD_DIR:
+            client = RecordingClient(client, StreamRecorder(STREAM_RECORD_DIR))
         try:
-            await asyncio.gather(
-                get_metadata(client, uid_list, queue_metadata),
-                extract_candle(shares, queue_metadata, queue_candle),
-                update_dataframe(queue_candle, df, rabbit)
-            )
-        except asyncio.CancelledError:
-            print("Get interrupt")
-            raise
+            await run(client, scheduler, rabbit, history)
+        finally:
+            if STREAM_RECORD_DIR:
+                await client.recorder.flush()
+            await rabbit.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 from t_tech.invest import Client
 
-from config import INVEST_TOKEN
+from config import INVEST_TOKEN, INVEST_TARGET
+from request_scheduler import RequestScheduler
 
 
 def get_price(x):
@@ -50,8 +51,8 @@ class Bond:
         )
 
 
-def get_account_data(client, total: dict, bonds: dict):
-    accounts = client.users.get_accounts().accounts
+def get_account_data(client, scheduler: RequestScheduler, total: dict, bonds: dict):
+    accounts = scheduler.call_sync("get_accounts", client.users.get_accounts).accounts
 
     pos_dict = {
         "bond": {},
@@ -61,14 +62,18 @@ def get_account_data(client, total: dict, bonds: dict):
     total_rub = 0
 
     for account in accounts:
-        portfolio = client.operations.get_portfolio(account_id=account.id)
+        portfolio = scheduler.call_sync(
+            "get_portfolio", client.operations.get_portfolio, account_id=account.id
+        )
         total["portfolio"] += get_price(portfolio.total_amount_portfolio)
         total["bonds"] += get_price(portfolio.total_amount_bonds)
         total["shares"] += get_price(portfolio.total_amount_shares)
         total["etfs"] += get_price(portfolio.total_amount_etf)
         total["currencies"] += get_price(portfolio.total_amount_currencies)
 
-        positions = client.operations.get_positions(account_id=account.id)
+        positions = scheduler.call_sync(
+            "get_positions", client.operations.get_positions, account_id=account.id
+        )
         print(f"Positions of {account.name}:")
         for i in positions.money:
             if i.currency == "rub":
@@ -150,7 +155,8 @@ def play_portfolio_response(client):
 
 
 def main():
-    with Client(INVEST_TOKEN) as client:
+    scheduler = RequestScheduler()
+    with Client(INVEST_TOKEN, target=INVEST_TARGET) as client:
         total = {
             "portfolio": 0.0,
             "bonds": 0.0,
@@ -160,10 +166,11 @@ def main():
         }
         bonds = {}
 
-        get_account_data(client, total, bonds)
+        get_account_data(client, scheduler, total, bonds)
         # print_portfolio(total, bonds)
         for k, v in total.items():
             print(f"{k}: {v:,.0f}")
+        print(scheduler.report())
 
 
 if __name__ == "__main__":
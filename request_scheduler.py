@@ -0,0 +1,229 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from grpc import StatusCode
+
+
+# Лимиты unary-методов T-Invest API, запросов в минуту
+METHOD_LIMITS = {
+    "get_candles": 600,
+    "shares": 200,
+    "bonds": 200,
+    "get_portfolio": 200,
+    "get_positions": 200,
+    "get_accounts": 100,
+}
+DEFAULT_LIMIT = 100
+
+RETRY_CODES = {
+    StatusCode.RESOURCE_EXHAUSTED,
+    StatusCode.UNAVAILABLE,
+    StatusCode.DEADLINE_EXCEEDED,
+}
+
+
+def error_code(e: Exception):
+    return getattr(e, "code", None)
+
+
+def ratelimit_reset(e: Exception) -> float | None:
+    """Через сколько секунд сервер обнулит лимит (из метаданных ответа)."""
+    reset = getattr(getattr(e, "metadata", None), "ratelimit_reset", None)
+    return float(reset) if reset else None
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def drain(self, seconds: float):
+        """Сервер сообщил об исчерпании лимита: не выдавать токены seconds секунд."""
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+            self.updated = time.monotonic()
+
+
+class AdaptiveConcurrency:
+    """
+    Ограничение числа одновременных запросов по схеме AIMD: +1 после
+    limit успешных ответов подряд, вдвое меньше при троттлинге.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 50):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def increase(self):
+        self.successes += 1
+        if self.successes >= self.limit:
+            self.limit = min(self.maximum, self.limit + 1)
+            self.successes = 0
+
+    def decrease(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self.successes = 0
+
+
+@dataclass
+class MethodStats:
+    calls: int = 0
+    ok: int = 0
+    errors: int = 0
+    throttled: int = 0
+    retries: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    def observe(self, latency: float):
+        self.ok += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+
+class RequestScheduler:
+    """
+    Общий планировщик запросов к API: корзина токенов на каждый метод по его
+    лимиту, адаптивная параллельность, повтор с экспоненциальной паузой при
+    троттлинге и статистика по методам. Корзина вмещает burst секунд лимита:
+    за любую минуту уходит не больше минутной квоты и этого небольшого запаса.
+    """
+
+    def __init__(self, limits: dict[str, int] | None = None, concurrency: int = 10,
+                 max_concurrency: int = 50, max_retries: int = 5, headroom: float = 0.9,
+                 burst: float = 3.0):
+        self.limits = {**METHOD_LIMITS, **(limits or {})}
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.headroom = headroom
+        self.burst = burst
+        self.buckets: dict[str, TokenBucket] = {}
+        self.limiters: dict[str, AdaptiveConcurrency] = {}
+        self.stats: dict[str, MethodStats] = {}
+        self.started = time.monotonic()
+
+    def _bucket(self, method: str) -> TokenBucket:
+        bucket = self.buckets.get(method)
+        if bucket is None:
+            rate = self.limits.get(method, DEFAULT_LIMIT) * self.headroom / 60
+            bucket = self.buckets[method] = TokenBucket(rate, max(1.0, rate * self.burst))
+            self.stats[method] = MethodStats()
+        return bucket
+
+    def _limiter(self, method: str) -> AdaptiveConcurrency:
+        limiter = self.limiters.get(method)
+        if limiter is None:
+            limiter = self.limiters[method] = AdaptiveConcurrency(
+                self.concurrency, maximum=self.max_concurrency
+            )
+        return limiter
+
+    def _backoff(self, method: str, e: Exception, attempt: int) -> float:
+        stats = self.stats[method]
+        stats.retries += 1
+        delay = min(60.0, 0.5 * 2 ** attempt) * (1 + random.random() / 2)
+        if error_code(e) == StatusCode.RESOURCE_EXHAUSTED:
+            stats.throttled += 1
+            delay = ratelimit_reset(e) or delay
+            self.buckets[method].drain(delay)
+        return delay
+
+    def _retryable(self, e: Exception, attempt: int) -> bool:
+        return error_code(e) in RETRY_CODES and attempt < self.max_retries
+
+    async def call(self, method: str, func, *args, **kwargs):
+        bucket = self._bucket(method)
+        limiter = self._limiter(method)
+        stats = self.stats[method]
+
+        attempt = 0
+        while True:
+            await asyncio.sleep(bucket.reserve())
+            async with limiter:
+                stats.calls += 1
+                started = time.monotonic()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    if not self._retryable(e, attempt):
+                        stats.errors += 1
+                        raise
+                    if error_code(e) == StatusCode.RESOURCE_EXHAUSTED:
+                        limiter.decrease()
+                    delay = self._backoff(method, e, attempt)
+                else:
+                    stats.observe(time.monotonic() - started)
+                    limiter.increase()
+                    return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def call_sync(self, method: str, func, *args, **kwargs):
+        """То же для синхронного Client: без параллельности, с ожиданием токена и повтором."""
+        bucket = self._bucket(method)
+        stats = self.stats[method]
+
+        attempt = 0
+        while True:
+            time.sleep(bucket.reserve())
+            stats.calls += 1
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self._retryable(e, attempt):
+                    stats.errors += 1
+                    raise
+                time.sleep(self._backoff(method, e, attempt))
+                attempt += 1
+            else:
+                stats.observe(time.monotonic() - started)
+                return result
+
+    def report(self) -> str:
+        elapsed = time.monotonic() - self.started
+        lines = [
+            f"{'Method':<16} {'Calls':>6} {'OK':>6} {'Err':>4} {'Thr':>4} {'Retry':>5} "
+            f"{'Req/s':>7} {'Avg ms':>8} {'Max ms':>8} {'Conc':>4}"
+        ]
+        for method, s in self.stats.items():
+            limiter = self.limiters.get(method)
+            avg = s.latency_total / s.ok * 1000 if s.ok else 0.0
+            lines.append(
+                f"{method:<16} {s.calls:>6} {s.ok:>6} {s.errors:>4} {s.throttled:>4} {s.retries:>5} "
+                f"{s.ok / elapsed:>7.2f} {avg:>8.1f} {s.latency_max * 1000:>8.1f} "
+                f"{limiter.limit if limiter else 1:>4}"
+            )
+        return "\n".join(lines)
@@ -1,12 +1,13 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 import asyncio
-import json
+import time
 
 from message_announcer import MessageAnnouncer
+from metrics import REGISTRY, observe_stages
 from rabbitmq import RabbitMQConsumer
 
 
@@ -14,6 +15,19 @@ from rabbitmq import RabbitMQConsumer
 announcer = MessageAnnouncer()
 consumer = RabbitMQConsumer(announcer)
 
+SSE_EVENTS = REGISTRY.counter("signals_sse_events_total", "Events written to SSE clients")
+REGISTRY.gauge("signals_sse_clients", "Connected SSE clients", fn=lambda: {(): len(announcer.listeners)})
+REGISTRY.gauge(
+    "signals_sse_client_lag_max", "Largest number of events waiting for one SSE client",
+    fn=lambda: {(): max((x.lag for x in announcer.listeners), default=0)},
+)
+for _name in ("dropped", "coalesced", "evicted"):
+    REGISTRY.counter(
+        f"signals_sse_{_name}_total", f"SSE events {_name} for slow clients" if _name != "evicted"
+        else "SSE clients disconnected for falling behind",
+        fn=lambda name=_name: {(): announcer.totals()[name]},
+    )
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -43,25 +57,63 @@ app.add_middleware(
 
 @app.get("/stream")
 async def sse_endpoint(request: Request):
-    """Ендпоинт для подключения по SSE."""
+    """
+    Ендпоинт для подключения по SSE. Клиент, вернувшийся с заголовком
+    Last-Event-ID (или параметром last_event_id), получает пропущенные алерты.
+    """
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
 
     async def event_generator():
-        # Создаем персональную очередь для этого HTTP-запроса
-        q = announcer.listen()
+        # Создаем персональную ограниченную очередь для этого HTTP-запроса
+        listener = announcer.listen()
+        missed = announcer.replay(last_event_id) if last_event_id is not None else []
         try:
+            # Переподключившийся клиент сначала получает пропущенные события
+            for event in missed:
+                yield event.data
+                listener.sent += 1
+                SSE_EVENTS.inc()
+            del missed
+
             while True:
                 # Ждем появление нового сообщения (блокирует только эту корутину)
-                msg = await q.get()
-
-                # Формат SSE требует префикса 'data:' и двух переносов строки
-                yield f"data: {json.dumps(msg, ensure_ascii=False)}\n\n"
+                event = await listener.get()
+                if event is None or listener.evicted:
+                    # Клиент отстал и отключен политикой disconnect
+                    return
+
+                # Событие уже закодировано в SSE-байты один раз на всех клиентов
+                yield event.data
+                listener.sent += 1
+                SSE_EVENTS.inc()
+                if event.stages:
+                    observe_stages({**event.stages, "sse": time.time()}, ("sse",))
 
         except asyncio.CancelledError:
             # Срабатывает, когда клиент закрывает вкладку браузера или обрывает связь
             print("🚫 Клиент отключился")
         finally:
             # Обязательно удаляем очередь, чтобы не было утечек памяти
-            announcer.remove(q)
+            announcer.remove(listener)
 
     # Возвращаем стрим с правильным MIME-типом для SSE
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
\ No newline at end of file
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
+@app.get("/stream/clients")
+async def sse_clients():
+    """Счетчики каждого SSE-клиента: отправлено, отставание, выброшено."""
+    return {
+        "clients": [x.stats() for x in announcer.listeners],
+        **announcer.totals(),
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,458 @@
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import polars as pl
+
+import clock
+from config import HISTORY_BUCKETS, HISTORY_FLUSH_SECONDS, BATCH_DEADLINE_SECONDS
+from history_store import HistoryStore
+from metrics import STAGES, STAGE_LATENCY, observe_stages
+from request_scheduler import RequestScheduler
+
+
+# Источник строки записи
+STREAM = 0
+HISTORY = 1
+
+PRICES = ("open", "high", "low", "close")
+
+# Без пауз: как часто пайплайн проверяет дедлайны минут
+MAX_SPEED_POLL = 0.005
+
+RECORD_SCHEMA = {
+    "recv": pl.Float64,
+    "kind": pl.UInt8,
+    "uid": pl.Utf8,
+    **{f"{p}_{part}": pl.Int64 for p in PRICES for part in ("units", "nano")},
+    "volume": pl.Int64,
+    "time": pl.Int64,
+    "is_complete": pl.Boolean,
+}
+
+
+def _row(recv: float, kind: int, uid: str, c, is_complete: bool) -> tuple:
+    o, h, l, cl = c.open, c.high, c.low, c.close
+    return (
+        recv, kind, uid,
+        o.units, o.nano, h.units, h.nano, l.units, l.nano, cl.units, cl.nano,
+        c.volume, round(c.time.timestamp() * 1e6), is_complete,
+    )
+
+
+class StreamRecorder:
+    """
+    Пишет свечи сессии в каталог записи: сообщения market_data_stream и
+    ответы get_candles с unix-временем получения recv, по файлу
+    {prefix}-*.arrow (Arrow IPC, zstd) на каждые flush_rows строк или
+    flush_seconds секунд, файл пишется в отдельном потоке. Справочник
+    инструментов - в shares.json.
+    """
+
+    def __init__(self, root: Path, prefix: str = "main", flush_rows: int = 10_000,
+                 flush_seconds: float = 60.0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows: list[tuple] = []
+        self.last_flush = time.monotonic()
+
+    def shares(self, instruments):
+        data = [
+            {"uid": x.uid, "ticker": x.ticker, "name": x.name, "currency": x.currency}
+            for x in instruments
+        ]
+        (self.root / "shares.json").write_text(json.dumps(data, ensure_ascii=False))
+
+    def stream(self, candle):
+        self.rows.append(_row(time.time(), STREAM, candle.instrument_uid, candle, True))
+
+    def history(self, uid: str, candles):
+        recv = time.time()
+        self.rows.extend(_row(recv, HISTORY, uid, c, c.is_complete) for c in candles)
+
+    @property
+    def due(self) -> bool:
+        return len(self.rows) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds
+
+    def _write(self, rows: list[tuple], path: Path):
+        pl.DataFrame(rows, schema=RECORD_SCHEMA, orient="row").write_ipc(path, compression="zstd")
+
+    async def flush(self):
+        rows, self.rows = self.rows, []
+        self.last_flush = time.monotonic()
+        if rows:
+            path = self.root / f"{self.prefix}-{time.time_ns()}.arrow"
+            await asyncio.to_thread(self._write, rows, path)
+
+
+class _RecordingInstruments:
+    def __init__(self, instruments, recorder: StreamRecorder):
+        self.instruments = instruments
+        self.recorder = recorder
+
+    async def shares(self, *args, **kwargs):
+        response = await self.instruments.shares(*args, **kwargs)
+        self.recorder.shares(response.instruments)
+        return response
+
+
+class _RecordingMarketData:
+    def __init__(self, market_data, recorder: StreamRecorder):
+        self.market_data = market_data
+        self.recorder = recorder
+
+    async def get_candles(self, *args, instrument_id: str, **kwargs):
+        response = await self.market_data.get_candles(*args, instrument_id=instrument_id, **kwargs)
+        self.recorder.history(instrument_id, response.candles)
+        if self.recorder.due:
+            await self.recorder.flush()
+        return response
+
+
+class _RecordingStream:
+    def __init__(self, stream, recorder: StreamRecorder):
+        self.stream = stream
+        self.recorder = recorder
+
+    async def market_data_stream(self, requests):
+        async for response in self.stream.market_data_stream(requests):
+            if response.candle:
+                self.recorder.stream(response.candle)
+                if self.recorder.due:
+                    await self.recorder.flush()
+            yield response
+
+
+class RecordingClient:
+    """Обертка AsyncClient: запросы проходят насквозь, свечи пишутся в recorder."""
+
+    def __init__(self, client, recorder: StreamRecorder):
+        self.client = client
+        self.recorder = recorder
+        self.instruments = _RecordingInstruments(client.instruments, recorder)
+        self.market_data = _RecordingMarketData(client.market_data, recorder)
+        self.market_data_stream = _RecordingStream(client.market_data_stream, recorder)
+
+
+@dataclass(slots=True)
+class Quotation:
+    units: int
+    nano: int
+
+
+@dataclass(slots=True)
+class Candle:
+    instrument_uid: str
+    open: Quotation
+    high: Quotation
+    low: Quotation
+    close: Quotation
+    volume: int
+    time: datetime
+    is_complete: bool = True
+
+
+@dataclass(slots=True)
+class StreamResponse:
+    candle: Candle | None = None
+
+
+def read_recording(root: Path) -> pl.DataFrame:
+    files = sorted(Path(root).glob("*.arrow"))
+    if not files:
+        raise FileNotFoundError(f"No recorded candles in {root}")
+    return pl.concat([pl.read_ipc(x) for x in files]).sort("recv", maintain_order=True)
+
+
+def _candles(df: pl.DataFrame) -> list[Candle]:
+    times = df["time"].cast(pl.Datetime("us", "UTC")).to_list()
+    columns = [df[c].to_list() for c in RECORD_SCHEMA if c not in ("recv", "kind", "time")]
+    return [
+        Candle(uid, Quotation(ou, on), Quotation(hu, hn), Quotation(lu, ln), Quotation(cu, cn),
+               volume, ts, complete)
+        for (uid, ou, on, hu, hn, lu, ln, cu, cn, volume, complete), ts in zip(zip(*columns), times)
+    ]
+
+
+class ReplayClock:
+    """
+    Время записи. speed > 0 - запись идет в speed раз быстрее реальной,
+    speed = 0 - без пауз: часы стоят на времени получения последнего
+    отданного сообщения, после конца записи идут в реальном темпе.
+    Пайплайн сообщает часам, какие свечи принял и какие минуты
+    проанализировал, воспроизведение ждет этих событий без опроса.
+    """
+
+    def __init__(self, start: float, speed: float = 1.0):
+        self.start = start
+        self.speed = speed
+        self.wall = time.monotonic()
+        self.cursor = start
+        self.released: float | None = None
+        # Без пауз: uid -> минута последней отданной потоком свечи, которую
+        # пайплайн еще не принял, и начало последней проанализированной минуты
+        self.pending: dict[str, float] = {}
+        self.analyzed_until = float("-inf")
+        self.changed = asyncio.Event()
+
+    def time(self) -> float:
+        if self.speed > 0:
+            return self.start + (time.monotonic() - self.wall) * self.speed
+        if self.released is not None:
+            return self.cursor + time.monotonic() - self.released
+        return self.cursor
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time(), timezone.utc)
+
+    async def wait(self, recv: float):
+        """Ждет момента получения сообщения recv по часам записи."""
+        if self.speed > 0:
+            delay = (recv - self.time()) / self.speed
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            self.cursor = max(self.cursor, recv)
+            # Отдает управление пайплайну, как это делает настоящий поток
+            await asyncio.sleep(0)
+
+    def timeout(self, seconds: float | None) -> float | None:
+        if seconds is None or self.speed > 0:
+            return seconds if seconds is None else seconds / self.speed
+        if self.released is not None:
+            return seconds
+        # Без пауз часы двигают сообщения, а не секунды: дедлайны проверяются часто
+        return min(seconds, MAX_SPEED_POLL)
+
+    def release(self):
+        if self.released is None:
+            self.released = time.monotonic()
+
+    def notify(self):
+        """Будит всех, кто ждет в wait_for."""
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for(self, predicate):
+        while not predicate():
+            await self.changed.wait()
+
+    def sent(self, uid: str, minute: float):
+        self.pending[uid] = max(minute, self.pending.get(uid, minute))
+
+    def received(self, df: pl.DataFrame):
+        if not self.pending:
+            return
+        last = df.group_by("uid").agg(pl.col("timestamp_utc").max())
+        for uid, ts in zip(last["uid"], last["timestamp_utc"]):
+            if self.pending.get(uid, float("inf")) <= ts.timestamp():
+                del self.pending[uid]
+        if not self.pending:
+            self.notify()
+
+    def analyzed(self, minute: datetime):
+        self.analyzed_until = max(self.analyzed_until, minute.timestamp())
+        self.notify()
+
+
+class _ReplayInstruments:
+    def __init__(self, shares: list[dict]):
+        self.instruments = [SimpleNamespace(**x) for x in shares]
+
+    async def shares(self, *args, **kwargs):
+        return SimpleNamespace(instruments=self.instruments)
+
+
+class _ReplayMarketData:
+    def __init__(self, history: pl.DataFrame, clock_: ReplayClock):
+        self.history = history.partition_by("uid", as_dict=True)
+        self.clock = clock_
+
+    async def get_candles(self, *, instrument_id: str, from_: datetime, to: datetime, **kwargs):
+        """Записанные ответы get_candles, полученные к текущему времени записи."""
+        df = self.history.get((instrument_id,))
+        if df is None:
+            return SimpleNamespace(candles=[])
+        df = df.filter(
+            pl.col("recv") <= self.clock.time(),
+            pl.col("time") >= round(from_.timestamp() * 1e6),
+            pl.col("time") < round(to.timestamp() * 1e6),
+        ).unique(subset=["time"], keep="last").sort("time")
+        return SimpleNamespace(candles=_candles(df))
+
+
+class _ReplayStream:
+    def __init__(self, stream: pl.DataFrame, clock_: ReplayClock):
+        self.stream = stream
+        self.clock = clock_
+        self.active = 0
+        self.finished = asyncio.Event()
+        # Потоки, отдавшие свою часть минуты: поток -> до какого времени записи
+        # можно двигать часы (дедлайн минуты или следующее сообщение)
+        self.waiting: dict[object, float] = {}
+        # Последняя минута, после которой часы уже переведены
+        self.opened = float("-inf")
+
+    async def minute_barrier(self, token: object, minute: float, next_recv: float):
+        """
+        Без пауз: следующая минута ждет, пока пайплайн проанализирует
+        текущую, иначе все минуты слились бы в одну пачку. Когда все потоки
+        отдали минуту и пайплайн принял все их свечи, часы идут к ближайшему
+        из следующего сообщения и дедлайна минуты. Дошли до дедлайна -
+        неполная минута уходит на анализ, и поток ждет его.
+        """
+        clock_ = self.clock
+        deadline = minute + 60 + BATCH_DEADLINE_SECONDS
+        self.waiting[token] = min(next_recv, deadline)
+        clock_.notify()
+        try:
+            await clock_.wait_for(lambda: (
+                clock_.analyzed_until >= minute or self.opened >= minute
+                or (len(self.waiting) == self.active and not clock_.pending)
+            ))
+            if clock_.analyzed_until < minute and self.opened < minute:
+                self.opened = minute
+                clock_.cursor = max(clock_.cursor, min(self.waiting.values()))
+            if clock_.cursor >= deadline:
+                await clock_.wait_for(lambda: clock_.analyzed_until >= minute)
+        finally:
+            del self.waiting[token]
+
+    async def market_data_stream(self, requests):
+        request = await anext(requests)
+        uids = [x.instrument_id for x in request.subscribe_candles_request.instruments]
+        df = self.stream.filter(pl.col("uid").is_in(uids))
+
+        self.active += 1
+        token = object()
+        minute = None
+        for recv, candle in zip(df["recv"].to_list(), _candles(df)):
+            candle_minute = candle.time.timestamp()
+            if self.clock.speed == 0 and minute is not None and candle_minute > minute:
+                await self.minute_barrier(token, minute, recv)
+            minute = candle_minute if minute is None else max(minute, candle_minute)
+            await self.clock.wait(recv)
+            if self.clock.speed == 0:
+                self.clock.sent(candle.instrument_uid, candle_minute)
+            yield StreamResponse(candle=candle)
+        self.active -= 1
+        # Оставшиеся потоки больше не ждут этот у барьера минуты
+        self.clock.notify()
+        if not self.active:
+            self.clock.release()
+            self.finished.set()
+        # Запись кончилась, но поток не закрывается, как и настоящий
+        await asyncio.Event().wait()
+
+
+class ReplayClient:
+    """Заменяет AsyncClient: отдает записанные справочник, историю и поток."""
+
+    def __init__(self, root: Path, speed: float = 1.0):
+        root = Path(root)
+        df = read_recording(root)
+        stream = df.filter(pl.col("kind") == STREAM)
+        start = stream["recv"].min() if not stream.is_empty() else df["recv"].max()
+        self.clock = ReplayClock(start, speed)
+        self.instruments = _ReplayInstruments(json.loads((root / "shares.json").read_text()))
+        self.market_data = _ReplayMarketData(df.filter(pl.col("kind") == HISTORY), self.clock)
+        self.market_data_stream = _ReplayStream(stream, self.clock)
+        self.candles = stream.height
+
+    @property
+    def finished(self) -> asyncio.Event:
+        return self.market_data_stream.finished
+
+
+class NullPublisher:
+    """Вместо RabbitMQ: считает алерты и отмечает этап published."""
+
+    def __init__(self):
+        self.published = 0
+
+    async def publish_batch(self, alerts: list[dict]):
+        for alert in alerts:
+            if "stages" in alert:
+                alert["stages"]["published"] = clock.time()
+                observe_stages(alert["stages"], ("published",))
+        self.published += len(alerts)
+
+
+def stages_report() -> str:
+    lines = [f"{'Stage':<10} {'Count':>8} {'Avg s':>7} {'p50 s':>7} {'p95 s':>7}"]
+    for stage in STAGES:
+        data = STAGE_LATENCY.values.get((stage,))
+        if data is None:
+            continue
+        _, total, count = data
+        lines.append(
+            f"{stage:<10} {count:>8} {total / count:>7.2f} "
+            f"{STAGE_LATENCY.quantile(0.5, stage=stage):>7.2f} {STAGE_LATENCY.quantile(0.95, stage=stage):>7.2f}"
+        )
+    return "\n".join(lines)
+
+
+async def replay(root: Path, speed: float, metrics_port: int = 0):
+    # Импорт здесь: price_change_signal сам импортирует запись из этого модуля
+    from price_change_signal import CANDLES_ANALYZED, run
+
+    client = ReplayClient(root, speed)
+    clock.set_clock(client.clock)
+    publisher = NullPublisher()
+    print(f"Replaying {client.candles} stream candles from {root}, speed {speed or 'max'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = HistoryStore(Path(tmp), HISTORY_BUCKETS, HISTORY_FLUSH_SECONDS)
+        started = time.monotonic()
+        task = asyncio.create_task(
+            run(client, RequestScheduler(), publisher, history,
+                shard_processes=False, metrics_port=metrics_port)
+        )
+        finished = asyncio.create_task(client.finished.wait())
+        await asyncio.wait([task, finished], return_when=asyncio.FIRST_COMPLETED)
+
+        # Последние минуты уходят на анализ по дедлайну: ждем, пока счетчик
+        # не простоит дедлайн, и считаем время до последнего изменения
+        analyzed = CANDLES_ANALYZED.values.get((), 0)
+        changed = time.monotonic()
+        while not task.done() and time.monotonic() - changed < BATCH_DEADLINE_SECONDS + 1:
+            await asyncio.sleep(0.1)
+            if CANDLES_ANALYZED.values.get((), 0) != analyzed:
+                analyzed = CANDLES_ANALYZED.values.get((), 0)
+                changed = time.monotonic()
+        elapsed = changed - started
+
+        finished.cancel()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    print(f"Replay done in {elapsed:.1f}s: {analyzed} candles analyzed ({analyzed / elapsed:.0f}/s), "
+          f"{publisher.published} alerts ({publisher.published / elapsed:.1f}/s)")
+    print(stages_report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанной сессии рыночных данных")
+    parser.add_argument("path", type=Path, help="каталог записи (STREAM_RECORD_DIR)")
+    parser.add_argument("--speed", default="1",
+                        help="во сколько раз быстрее реального времени, max - без пауз")
+    parser.add_argument("--metrics-port", type=int, default=0)
+    args = parser.parse_args()
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    asyncio.run(replay(args.path, speed, args.metrics_port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import asyncio
+from dataclasses import dataclass, asdict, field
+
+import clock
+from bounded_queue import queues_report
+from metrics import REGISTRY
+
+
+def split_shards(shares: dict, shards: int) -> list[dict]:
+    """Делит инструменты на shards групп примерно равного размера."""
+    shards = max(1, min(shards, len(shares)))
+    parts = [{} for _ in range(shards)]
+    for i, (uid, info) in enumerate(shares.items()):
+        parts[i % shards][uid] = info
+    return parts
+
+
+@dataclass
+class ShardStats:
+    shard: int
+    instruments: int
+    connected: bool = False
+    restarts: int = 0
+    reconnects: int = 0
+    errors: int = 0
+    messages: int = 0
+    candles: int = 0
+    batches: int = 0
+    last_message: float | None = None
+    # Снимок BoundedQueue.stats() очереди сообщений потока шарда
+    queue: dict = field(default_factory=dict)
+
+    def on_message(self):
+        self.messages += 1
+        self.last_message = clock.time()
+
+    def snapshot(self) -> dict:
+        return asdict(self)
+
+    def restore(self, data: dict):
+        """Снимок из процесса шарда. Перезапуски процесса считает родитель."""
+        for key, value in data.items():
+            if key != "restarts":
+                setattr(self, key, value)
+
+
+def shards_report(stats: list[ShardStats]) -> str:
+    lines = [
+        f"{'Shard':>5} {'Inst':>5} {'Conn':>4} {'Restart':>7} {'Reconn':>6} {'Err':>4} "
+        f"{'Msgs':>8} {'Candles':>8} {'Batches':>7} {'Idle s':>7}"
+    ]
+    now = clock.time()
+    for s in stats:
+        idle = f"{now - s.last_message:.0f}" if s.last_message else "-"
+        lines.append(
+            f"{s.shard:>5} {s.instruments:>5} {'yes' if s.connected else 'no':>4} {s.restarts:>7} {s.reconnects:>6} "
+            f"{s.errors:>4} {s.messages:>8} {s.candles:>8} {s.batches:>7} {idle:>7}"
+        )
+    return "\n".join(lines)
+
+
+async def report_shards(stats: list[ShardStats], interval: float, queues=(), batches=None):
+    while True:
+        await asyncio.sleep(interval)
+        print(shards_report(stats))
+        print(queues_report([*(s.queue for s in stats if s.queue), *(q.stats() for q in queues)]))
+        if batches is not None:
+            print(batches.report())
+
+
+def register_metrics(stats: list[ShardStats], queues=(), batches=None):
+    """Публикует статистику шардов, очередей и минутных пачек в /metrics."""
+
+    def queue_stats():
+        return [*(s.queue for s in stats if s.queue), *(q.stats() for q in queues)]
+
+    for field_name, kind in (("connected", "gauge"), ("restarts", "counter"), ("reconnects", "counter"),
+                             ("errors", "counter"), ("messages", "counter"), ("candles", "counter")):
+        register = REGISTRY.counter if kind == "counter" else REGISTRY.gauge
+        register(
+            f"signals_shard_{field_name}" + ("_total" if kind == "counter" else ""),
+            f"Shard {field_name}", labels=("shard",),
+            fn=lambda f=field_name: {(s.shard,): int(getattr(s, f)) for s in stats},
+        )
+    for field_name, kind in (("depth", "gauge"), ("high_water", "gauge"),
+                             ("dropped", "counter"), ("coalesced", "counter")):
+        register = REGISTRY.counter if kind == "counter" else REGISTRY.gauge
+        register(
+            f"signals_queue_{field_name}" + ("_total" if kind == "counter" else ""),
+            f"Pipeline queue {field_name}", labels=("queue",),
+            fn=lambda f=field_name: {(q["name"],): q[f] for q in queue_stats()},
+        )
+    if batches is not None:
+        REGISTRY.counter(
+            "signals_batches_total", "Minute batches flushed by reason", labels=("reason",),
+            fn=lambda: {(reason,): n for reason, n in batches.flushes.items()},
+        )
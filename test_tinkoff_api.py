@@ -16,7 +16,7 @@ from t_tech.invest import (
 )
 from t_tech.invest.utils import now
 
-from config import INVEST_TOKEN, data_path
+from config import INVEST_TOKEN, INVEST_TARGET, data_path
 
 
 shares_json_path = data_path / "shares.json"
@@ -136,7 +136,7 @@ async def extract_candle(uid_to_ticker: dict, in_queue: asyncio.Queue, out_queue
 
 
 async def main():
-    async with AsyncClient(INVEST_TOKEN) as client:
+    async with AsyncClient(INVEST_TOKEN, target=INVEST_TARGET) as client:
         shares = await get_rub_shares(client)
         tickers = ['SBER', 'GAZP', 'T', 'LKOH', 'NVTK']
         uid_to_ticker = {shares[ticker]['uid']: ticker for ticker in tickers}
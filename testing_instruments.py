@@ -3,7 +3,8 @@ import polars as pl
 from t_tech.invest import Client, CandleInterval
 from t_tech.invest.utils import now
 
-from config import INVEST_TOKEN
+from config import INVEST_TOKEN, INVEST_TARGET
+from request_scheduler import RequestScheduler
 
 
 def get_shares(client):
@@ -39,8 +40,8 @@ def get_shares(client):
           f"All instrument exchanges: {all_instrument_exchanges}\n")
 
 
-def check_volumes(client):
-    shares = client.instruments.shares()
+def check_volumes(client, scheduler: RequestScheduler):
+    shares = scheduler.call_sync("shares", client.instruments.shares)
     shares = {
         x.uid: {
             'ticker': x.ticker,
@@ -49,7 +50,9 @@ def check_volumes(client):
     }
     candles: list[dict] = []
     for uid in shares.keys():
-        raw_candles = client.market_data.get_candles(
+        raw_candles = scheduler.call_sync(
+            "get_candles",
+            client.market_data.get_candles,
             instrument_id=uid,
             to=now(),
             limit=50,
@@ -73,8 +76,10 @@ def check_volumes(client):
 
 
 def main():
-    with Client(INVEST_TOKEN) as client:
-        check_volumes(client)
+    scheduler = RequestScheduler()
+    with Client(INVEST_TOKEN, target=INVEST_TARGET) as client:
+        check_volumes(client, scheduler)
+    print(scheduler.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+from datetime import timedelta
+
+import polars as pl
+
+from candle_store import SCHEMA
+
+
+TIMEFRAMES = (1, 5, 15, 30, 60)
+
+ONE_MINUTE = timedelta(minutes=1)
+
+BARS_SCHEMA = {**SCHEMA, "_minutes": SCHEMA["timestamp_utc"]}
+CLOSED_SCHEMA = {"uid": SCHEMA["uid"], "_closed": SCHEMA["timestamp_utc"]}
+
+
+def rollup(df: pl.DataFrame, timeframe: int) -> pl.DataFrame:
+    """Собирает минутные свечи в бары timeframe минут одним запросом. Время бара - его начало."""
+    return (
+        df.sort(["uid", "timestamp_utc"])
+        .with_columns(
+            _minutes=pl.col("timestamp_utc"),
+            timestamp_utc=pl.col("timestamp_utc").dt.truncate(f"{timeframe}m"),
+        )
+        .group_by(["uid", "timestamp_utc"], maintain_order=True)
+        .agg(
+            pl.col("ticker").first(),
+            pl.col("name").first(),
+            pl.col("open").first(),
+            pl.col("high").max(),
+            pl.col("low").min(),
+            pl.col("close").last(),
+            pl.col("volume").sum(),
+            pl.col("_minutes").last(),
+        )
+        .select(*SCHEMA.keys(), "_minutes")
+    )
+
+
+def merge_bars(bars: pl.DataFrame, new: pl.DataFrame) -> pl.DataFrame:
+    """Доклеивает к открытым барам бары из более поздних минут тех же интервалов."""
+    return (
+        pl.concat([bars, new])
+        .group_by(["uid", "timestamp_utc"], maintain_order=True)
+        .agg(
+            pl.col("ticker").first(),
+            pl.col("name").first(),
+            pl.col("open").first(),
+            pl.col("high").max(),
+            pl.col("low").min(),
+            pl.col("close").last(),
+            pl.col("volume").sum(),
+            pl.col("_minutes").max(),
+        )
+        .select(*SCHEMA.keys(), "_minutes")
+    )
+
+
+class TimeframeAggregator:
+    """
+    Строит бары старших таймфреймов (5m/15m/30m/1h) из закрытых минутных
+    свечей потока. Бар отдается, как только закончился его интервал:
+    пришла последняя минута интервала или пачка с более поздней минутой.
+    Открытые бары хранятся кадром на таймфрейм, пачки обрабатываются целиком.
+    """
+
+    def __init__(self, timeframes):
+        self.timeframes = [tf for tf in timeframes if tf != 1]
+        for tf in self.timeframes:
+            if tf not in TIMEFRAMES:
+                raise ValueError(f"Unsupported timeframe {tf}, expected one of {TIMEFRAMES}")
+        # таймфрейм -> открытые бары и время последней вошедшей в них минуты (_minutes)
+        self.bars: dict[int, pl.DataFrame] = {tf: pl.DataFrame(schema=BARS_SCHEMA) for tf in self.timeframes}
+        # таймфрейм -> начало последнего отданного бара каждого uid (_closed)
+        self.closed: dict[int, pl.DataFrame] = {tf: pl.DataFrame(schema=CLOSED_SCHEMA) for tf in self.timeframes}
+
+    def _mark_closed(self, timeframe: int, completed: pl.DataFrame):
+        self.closed[timeframe] = (
+            pl.concat([
+                self.closed[timeframe],
+                completed.select("uid", _closed="timestamp_utc"),
+            ])
+            .group_by("uid")
+            .agg(pl.col("_closed").max())
+        )
+
+    def update_frame(self, df: pl.DataFrame) -> dict[int, pl.DataFrame]:
+        """
+        Добавляет пачку минутных свечей и закрывает бары, чьи интервалы
+        закончились к последней минуте пачки. Минуты не новее уже учтенных
+        отбрасываются. Возвращает закрытые бары по таймфреймам.
+        """
+        if df.is_empty():
+            return {tf: pl.DataFrame(schema=SCHEMA) for tf in self.timeframes}
+
+        until = df["timestamp_utc"].max() + ONE_MINUTE
+        result = {}
+        for tf in self.timeframes:
+            step = pl.duration(minutes=tf)
+            fresh = (
+                df.join(self.bars[tf].select("uid", _last="_minutes"), on="uid", how="left")
+                .join(self.closed[tf], on="uid", how="left")
+                .filter(
+                    (pl.col("_last").is_null() | (pl.col("timestamp_utc") > pl.col("_last")))
+                    & (pl.col("_closed").is_null() | (pl.col("timestamp_utc") >= pl.col("_closed") + step))
+                )
+                .select(SCHEMA.keys())
+            )
+            bars = merge_bars(self.bars[tf], rollup(fresh, tf))
+            is_open = pl.col("timestamp_utc") + step > until
+            self.bars[tf] = bars.filter(is_open)
+            completed = bars.filter(~is_open).drop("_minutes")
+            self._mark_closed(tf, completed)
+            result[tf] = completed.sort("timestamp_utc", maintain_order=True)
+        return result
+
+    def seed(self, df: pl.DataFrame) -> dict[int, pl.DataFrame]:
+        """
+        Строит бары по истории. Незавершенные интервалы становятся открытыми
+        барами агрегатора, завершенные возвращаются по таймфреймам.
+        """
+        if df.is_empty():
+            return {tf: pl.DataFrame(schema=SCHEMA) for tf in self.timeframes}
+
+        result = {}
+        history_end = df["timestamp_utc"].max() + ONE_MINUTE
+        for tf in self.timeframes:
+            bars = rollup(df, tf)
+            is_open = pl.col("timestamp_utc") + pl.duration(minutes=tf) > history_end
+            self.bars[tf] = bars.filter(is_open)
+            completed = bars.filter(~is_open).drop("_minutes")
+            self.closed[tf] = pl.DataFrame(schema=CLOSED_SCHEMA)
+            self._mark_closed(tf, completed)
+            result[tf] = completed
+        return result
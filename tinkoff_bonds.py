@@ -15,7 +15,8 @@ from t_tech.invest import (
     MoneyValue,
 )
 
-from config import INVEST_TOKEN, data_path
+from config import INVEST_TOKEN, INVEST_TARGET, data_path
+from request_scheduler import RequestScheduler
 
 
 bonds_parquet_path = data_path / "bonds.parquet"
@@ -118,12 +119,12 @@ class BondData:
         return x.units + (x.nano / 1e9)
 
 
-def get_bonds(client) -> Tuple[List[BondData], pl.DataFrame]:
+def get_bonds(client, scheduler: RequestScheduler) -> Tuple[List[BondData], pl.DataFrame]:
     data_path.mkdir(parents=True, exist_ok=True)
     if not bonds_parquet_path.exists():
         bond_objects = [
             BondData.from_tinkoff_object(x)
-            for x in client.instruments.bonds().instruments
+            for x in scheduler.call_sync("bonds", client.instruments.bonds).instruments
         ]
         df = pl.DataFrame([x.to_dict() for x in bond_objects])
         df.write_parquet(bonds_parquet_path)
@@ -137,8 +138,9 @@ def get_bonds(client) -> Tuple[List[BondData], pl.DataFrame]:
 
 
 def main():
-    with Client(INVEST_TOKEN) as client:
-        bonds_list, bonds_df = get_bonds(client)
+    scheduler = RequestScheduler()
+    with Client(INVEST_TOKEN, target=INVEST_TARGET) as client:
+        bonds_list, bonds_df = get_bonds(client, scheduler)
 
         print(f"Size of bonds list: {asizeof.asizeof(bonds_list) / 1024:.2f} KB")
         print(f"Size of bonds dataframe: {bonds_df.estimated_size() / 1024:.2f} KB")